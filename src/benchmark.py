@@ -0,0 +1,526 @@
+import argparse
+import glob
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from markdownify import markdownify as md
+from utils.parsing_preprocessing import split_text_into_components
+from utils.chunking import chunk_subsection
+from utils.embedding_store import EmbeddingStore
+from utils.numpy_search import NumpySearchIndex
+from utils.query_cache import QueryEmbeddingCache
+from utils.embedders import EMBEDDERS, Embedder, get_embedder, register_embedder, report_startup_benchmark
+from utils.subsections_io import iter_subsections
+from fake_embeddings_server import fake_embedding
+
+
+@register_embedder
+class FakeEmbedder(Embedder):
+    """Deterministic feature-hashing embeddings, for benchmarks without a model or network."""
+    name = "fake"
+    model = "fake-feature-hashing"
+    dimension = 384
+    max_batch_size = 256
+
+    def _load(self):
+        pass
+
+    def _embed(self, texts, instruction):
+        return [fake_embedding(text, self.dimension) for text in texts]
+
+
+def load_fixture_pages(pages_dir):
+    """Load the saved html pages of the benchmark fixtures as markdown.
+
+    Args:
+        pages_dir (str): Directory containing the saved .html pages.
+
+    Returns:
+        dict: page name -> markdown content.
+    """
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, 'r') as f:
+            pages[name] = md(f.read())
+    return pages
+
+
+def bench_preprocessing(pages_dir, golden_dir, repeat=20, update_golden=False):
+    """Check split_text_into_components against golden outputs and measure its throughput.
+
+    Args:
+        pages_dir (str): Directory containing the saved .html pages.
+        golden_dir (str): Directory containing the expected output of every page.
+        repeat (int): Number of timed runs per page. The best run is reported.
+        update_golden (bool): Overwrite the golden outputs instead of checking them.
+
+    Returns:
+        tuple: (results, mismatches) where results maps page name to MB/s and
+               mismatches lists the pages whose output differs from the golden file.
+    """
+    results = {}
+    mismatches = []
+    for name, markdown in load_fixture_pages(pages_dir).items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = split_text_into_components(markdown)
+            timings.append(time.perf_counter() - start)
+        mb_per_s = len(markdown.encode('utf-8')) / min(timings) / 1e6
+        results[name] = mb_per_s
+
+        golden_path = os.path.join(golden_dir, f"{name}.txt")
+        if update_golden:
+            os.makedirs(golden_dir, exist_ok=True)
+            with open(golden_path, 'w') as f:
+                f.write(output)
+            status = "updated"
+        elif not os.path.exists(golden_path):
+            status = "no golden"
+        else:
+            with open(golden_path, 'r') as f:
+                status = "ok" if f.read() == output else "MISMATCH"
+            if status == "MISMATCH":
+                mismatches.append(name)
+        print(f"{name: <50} {mb_per_s: >8.2f} MB/s  {status}")
+    return results, mismatches
+
+
+def latency_summary(timings):
+    """Format per-query timings (seconds) as mean / p50 / p95 milliseconds."""
+    timings_ms = np.asarray(timings) * 1000
+    return (f"mean {timings_ms.mean():7.3f} ms  p50 {np.percentile(timings_ms, 50):7.3f} ms  "
+            f"p95 {np.percentile(timings_ms, 95):7.3f} ms")
+
+
+def bench_search(embeddings_path, content_path, n_queries=200, top_k=10, seed=0):
+    """Compare the latency of the in-process numpy backend with the Qdrant collection.
+
+    Queries are stored vectors with a little noise, so no embedding model is needed.
+    The recall of Qdrant's approximate search is measured against the exact numpy results.
+
+    Args:
+        embeddings_path (str): Prefix of the embedding store.
+        content_path (str): Subsections ingested in the collection.
+        n_queries (int): Number of timed queries.
+        top_k (int): Number of hits per query.
+        seed (int): Seed of the query sampling.
+
+    Returns:
+        dict: backend name -> list of per-query timings in seconds.
+    """
+    import query_index
+
+    index = NumpySearchIndex(embeddings_path, content_path)
+    vectors = index.store.vectors()
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), n_queries)]
+    queries = queries + rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    block_types = query_index.parse_block_types(None)
+    _filter, _search_params, limit = query_index.build_search(top_k, block_types, None, None, index.chunked)
+    print(f"{len(index)} vectors of dimension {vectors.shape[1]}, {n_queries} queries, top {limit}")
+
+    timings = {"numpy": []}
+    exact = []
+    for vector in queries:
+        start = time.perf_counter()
+        hits = index.search(vector, limit, block_types)
+        timings["numpy"].append(time.perf_counter() - start)
+        exact.append({(hit.payload["url"], hit.payload["section_anchor"]) for hit in hits})
+    print(f"{'numpy': <8} {latency_summary(timings['numpy'])}")
+
+    collection_name = query_index.get_collection_name()
+    try:
+        query_index.CLIENT.get_collection(collection_name)
+    except Exception as e:
+        print(f"{'qdrant': <8} skipped, collection {collection_name} unavailable: {e}")
+        return timings
+    timings["qdrant"] = []
+    recalls = []
+    for vector, expected in zip(queries, exact):
+        start = time.perf_counter()
+        hits = query_index.CLIENT.search(
+            collection_name=collection_name,
+            query_vector=vector.tolist(),
+            query_filter=_filter,
+            limit=limit,
+            with_payload=["url", "section_anchor"],
+            search_params=_search_params,
+        )
+        timings["qdrant"].append(time.perf_counter() - start)
+        found = {(hit.payload["url"], hit.payload["section_anchor"]) for hit in hits}
+        recalls.append(len(found & expected) / max(len(expected), 1))
+    print(f"{'qdrant': <8} {latency_summary(timings['qdrant'])}  recall@{limit} {np.mean(recalls):.3f}")
+    return timings
+
+
+def cosine_similarities(a, b):
+    """Row-wise cosine similarity of two (n, dim) arrays."""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def top_k_rows(queries, documents, top_k):
+    """Indices of the top_k documents of every query by dot product, as sets."""
+    scores = np.asarray(queries, dtype=np.float32) @ np.asarray(documents, dtype=np.float32).T
+    top_k = min(top_k, scores.shape[1])
+    return [set(np.argpartition(-row, top_k - 1)[:top_k].tolist()) for row in scores]
+
+
+def bench_parity(reference, candidate, queries_file, content_path, n_documents=500, top_k=10):
+    """Compare the embeddings of a candidate backend (e.g. instructor-int8) to a reference one.
+
+    Both embed the same queries and a sample of the subsections. Reports the cosine
+    similarity of the paired vectors and the overlap of the top-k documents retrieved
+    for every query, which is the retrieval-quality cost of switching backends.
+
+    Args:
+        reference (str): Reference embedder, e.g. 'instructor'.
+        candidate (str): Candidate embedder of the same dimension, e.g. 'instructor-int8'.
+        queries_file (str): Queries, one per line.
+        content_path (str): Subsections (or chunks) whose first n_documents are embedded.
+        n_documents (int): Number of documents searched.
+        top_k (int): Number of hits compared per query.
+
+    Returns:
+        dict: Mean and min cosine similarities, mean top-k overlap, and embedding times.
+    """
+    with open(queries_file, 'r') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    documents = [subsection['content'] for _, subsection in itertools.islice(iter_subsections(content_path), n_documents)]
+    print(f"{len(queries)} queries, {len(documents)} documents, top {top_k}")
+
+    vectors = {}
+    seconds = {}
+    for name in (reference, candidate):
+        embedder = get_embedder(name).load()
+        start = time.perf_counter()
+        vectors[name] = (embedder.embed_queries(queries), embedder.embed_documents(documents))
+        seconds[name] = time.perf_counter() - start
+        print(f"{name: <20} embedded in {seconds[name]:7.2f}s ({(len(queries) + len(documents)) / seconds[name]:.1f} texts/s)")
+
+    query_cosines = cosine_similarities(vectors[reference][0], vectors[candidate][0])
+    document_cosines = cosine_similarities(vectors[reference][1], vectors[candidate][1])
+    expected = top_k_rows(*vectors[reference], top_k)
+    found = top_k_rows(*vectors[candidate], top_k)
+    overlaps = [len(e & f) / len(e) for e, f in zip(expected, found)]
+    results = {
+        "query_cosine_mean": float(query_cosines.mean()),
+        "query_cosine_min": float(query_cosines.min()),
+        "document_cosine_mean": float(document_cosines.mean()),
+        "document_cosine_min": float(document_cosines.min()),
+        f"top{top_k}_overlap": float(np.mean(overlaps)),
+        "seconds": seconds,
+    }
+    print(f"cosine queries   mean {results['query_cosine_mean']:.4f}  min {results['query_cosine_min']:.4f}")
+    print(f"cosine documents mean {results['document_cosine_mean']:.4f}  min {results['document_cosine_min']:.4f}")
+    print(f"top-{top_k} overlap {results[f'top{top_k}_overlap']:.3f}")
+    return results
+
+
+def check_openai_scheduler(n_texts=200, batch_size=16, rate_limit_rate=0.2, error_rate=0.1, seed=0):
+    """Run the OpenAI scheduler against a local fake endpoint that fails on purpose.
+
+    The fake answers a fraction of requests with 429 and 500, which must be retried,
+    and rejects every text over its token limit with 400, which must only drop the
+    batch's over-long texts.
+
+    Args:
+        n_texts (int): Number of texts embedded, one in ten of them too long.
+        batch_size (int): Number of texts per request.
+        rate_limit_rate (float): Fraction of requests answered with 429.
+        error_rate (float): Fraction of requests answered with 500.
+        seed (int): Seed of the fake's failures.
+
+    Returns:
+        list of str: The failed checks, empty on success.
+    """
+    import random
+    import threading
+    import openai
+    from fake_embeddings_server import FakeEmbeddingsHandler, FakeEmbeddingsServer
+    from utils import metrics
+    from utils.openai_scheduler import OpenAIEmbeddingScheduler
+
+    max_tokens = 50
+    handler = type("FailingEmbeddingsHandler", (FakeEmbeddingsHandler,), {
+        "dim": 8, "max_tokens": max_tokens, "rate_limit_rate": rate_limit_rate, "error_rate": error_rate,
+    })
+    server = FakeEmbeddingsServer(("localhost", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    previous_api = openai.api_base, openai.api_key
+    openai.api_base, openai.api_key = f"http://localhost:{server.server_address[1]}/v1", "fake"
+    recorder = metrics.enable()
+    retries_before = recorder.counters.get("openai_retries", 0)
+    random.seed(seed)
+
+    texts = [
+        " ".join(f"word{i}" for _ in range(max_tokens * 2)) if i % 10 == 0 else f"text number {i}"
+        for i in range(n_texts)
+    ]
+    items = list(enumerate(texts))
+    results = {}
+
+    def on_result(batch, embeddings, errors):
+        for (i, _), embedding, error in zip(batch, embeddings, errors):
+            results[i] = (embedding, error)
+
+    scheduler = OpenAIEmbeddingScheduler("text-embedding-ada-002", max_concurrency=4, backoff=0.01, max_retries=20)
+    try:
+        scheduler.embed_batches([items[i:i + batch_size] for i in range(0, n_texts, batch_size)], on_result)
+    finally:
+        server.shutdown()
+        server.server_close()
+        openai.api_base, openai.api_key = previous_api
+
+    failures = []
+    if len(results) != n_texts:
+        failures.append(f"{n_texts - len(results)} texts without a result")
+    for i, (embedding, error) in sorted(results.items()):
+        if i % 10 == 0 and (embedding is not None or error is None):
+            failures.append(f"over-long text {i} was not rejected")
+        if i % 10 != 0 and (embedding is None or not np.allclose(embedding, fake_embedding(texts[i], 8))):
+            failures.append(f"text {i} was not embedded")
+    n_retries = recorder.counters.get("openai_retries", 0) - retries_before
+    if (rate_limit_rate or error_rate) and not n_retries:
+        failures.append("no request was retried")
+    print(f"{len(results)} texts, {sum(embedding is None for embedding, _ in results.values())} rejected, {n_retries} retries")
+    return failures
+
+
+# pipeline metrics compared to the baseline, and whether higher values are better
+PIPELINE_METRICS = {
+    "parse_mb_per_s": True,
+    "embed_texts_per_s": True,
+    "upsert_points_per_s": True,
+    "query_p50_ms": False,
+    "query_p95_ms": False,
+    "query_p99_ms": False,
+}
+
+
+def fixture_corpus(pages_dir, copies):
+    """Parse the fixture pages and chunk them into a corpus of `copies` times their chunks.
+
+    Returns:
+        tuple: (parse results, list of (chunk id, chunk subsection)). The parse results hold
+               the html bytes parsed and the best parse time of all the pages.
+    """
+    from parse import parse_page
+
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, 'rb') as f:
+            pages[f"https://docs.unrealengine.com/5.1/en-US/{name.lower()}/"] = f.read()
+
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        parsed = {url: parse_page(url, content) for url, content in pages.items()}
+        timings.append(time.perf_counter() - start)
+
+    corpus = []
+    for copy in range(copies):
+        for url, (title, content) in parsed.items():
+            page_url = f"{url}?copy={copy}" if copy else url
+            corpus.extend(chunk_subsection(page_url, {"title": title, "content": content}))
+    n_bytes = sum(len(content) for content in pages.values())
+    return {"bytes": n_bytes, "seconds": min(timings)}, corpus
+
+
+def bench_pipeline(pages_dir, queries_file, copies=20, top_k=10, query_rounds=5, embedder="fake"):
+    """Offline end-to-end benchmark of the parse, embed, index and query stages.
+
+    Pages come from the html fixtures, embeddings from a deterministic embedder (no
+    model nor network with 'fake') and the collection lives in an in-memory Qdrant,
+    so the numbers only move when the code does.
+
+    Args:
+        pages_dir (str): Directory containing the saved .html pages.
+        queries_file (str): Queries, one per line.
+        copies (int): Number of copies of the fixture chunks indexed, to get a corpus of a useful size.
+        top_k (int): Number of hits per query.
+        query_rounds (int): Number of times every query is run, embedded again each time.
+        embedder (str): Embedder of the documents and queries.
+
+    Returns:
+        dict: The PIPELINE_METRICS and the sizes of the run.
+    """
+    import qdrant_client as qc
+    import create_index
+    import query_index
+
+    parse_results, corpus = fixture_corpus(pages_dir, copies)
+    with open(queries_file, 'r') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    print(f"{len(corpus)} chunks from {parse_results['bytes'] / 1e6:.2f} MB of html, {len(queries)} queries")
+
+    backend = get_embedder(embedder).load()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = EmbeddingStore(os.path.join(tmp_dir, f"{embedder}_embeddings"))
+        start = time.perf_counter()
+        texts = [chunk['content'] for _, chunk in corpus]
+        for (url, chunk), embedding in zip(corpus, backend.embed_documents(texts)):
+            store.add(url, chunk['title'], embedding)
+        store.flush()
+        embed_seconds = time.perf_counter() - start
+
+        # both modules search and ingest through their module-level client
+        client = qc.QdrantClient(":memory:")
+        create_index.client = query_index.CLIENT = client
+        create_index.DIMENSION = backend.dimension
+        query_index.COLLECTION_CACHE.invalidate()
+        collection_name = "ue5_docs_benchmark"
+        create_index.create_index(recreate=True, collection_name=collection_name)
+        start = time.perf_counter()
+        # the local client does not support concurrent upserts
+        n_points = create_index.add_doc_to_index(store, corpus, parallel=1, collection_name=collection_name)
+        upsert_seconds = time.perf_counter() - start
+
+    os.environ["UE5_DOCS_COLLECTION_NAME"] = collection_name
+    # every round embeds its queries again instead of timing hits of the query cache
+    previous_cache, query_index._query_cache = query_index._query_cache, QueryEmbeddingCache(max_entries=0)
+    timings = []
+    try:
+        for _ in range(query_rounds):
+            for query in queries:
+                start = time.perf_counter()
+                query_index.query_index(query, embedder, top_k=top_k, backend="qdrant", mode="dense")
+                timings.append(time.perf_counter() - start)
+    finally:
+        query_index._query_cache = previous_cache
+    timings_ms = np.asarray(timings) * 1000
+
+    results = {
+        "parse_mb_per_s": parse_results["bytes"] / parse_results["seconds"] / 1e6,
+        "embed_texts_per_s": len(corpus) / embed_seconds,
+        "upsert_points_per_s": n_points / upsert_seconds,
+        "query_p50_ms": float(np.percentile(timings_ms, 50)),
+        "query_p95_ms": float(np.percentile(timings_ms, 95)),
+        "query_p99_ms": float(np.percentile(timings_ms, 99)),
+        "embedder": embedder,
+        "copies": copies,
+        "n_chunks": len(corpus),
+        "n_points": n_points,
+        "n_queries": len(timings),
+    }
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """Print every pipeline metric next to its baseline value.
+
+    Args:
+        results (dict): Output of bench_pipeline.
+        baseline (dict): A previous output of bench_pipeline.
+        tolerance (float): Relative slowdown above which a metric is reported as a regression.
+
+    Returns:
+        list of str: The metrics that regressed.
+    """
+    regressions = []
+    for metric, higher_is_better in PIPELINE_METRICS.items():
+        value = results[metric]
+        if metric not in baseline:
+            print(f"{metric: <22} {value:12.3f}")
+            continue
+        change = value / baseline[metric] - 1 if baseline[metric] else 0.0
+        regressed = -change > tolerance if higher_is_better else change > tolerance
+        if regressed:
+            regressions.append(metric)
+        print(f"{metric: <22} {value:12.3f}  baseline {baseline[metric]:12.3f}  {change:+7.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    preprocessing_parser = subparsers.add_parser("preprocessing", help="Golden-output check and MB/s of split_text_into_components.")
+    preprocessing_parser.add_argument('--pages_dir', type=str, default='./benchmarks/fixtures/pages')
+    preprocessing_parser.add_argument('--golden_dir', type=str, default='./benchmarks/fixtures/golden')
+    preprocessing_parser.add_argument('--repeat', type=int, default=20)
+    preprocessing_parser.add_argument('--update_golden', action='store_true')
+
+    search_parser = subparsers.add_parser("search", help="Latency of the numpy search backend against Qdrant.")
+    search_parser.add_argument('--embeddings_path', type=str, default='./embeddings/instructor_embeddings')
+    search_parser.add_argument('--content_path', type=str, default='./documents/subsections.json')
+    search_parser.add_argument('--n_queries', type=int, default=200)
+    search_parser.add_argument('--top_k', type=int, default=10)
+
+    startup_parser = subparsers.add_parser("startup", help="Cold-start time of the embedding backends.")
+    # the fake embedder only exists in this process
+    startup_parser.add_argument('--embedders', type=str, nargs='+', default=sorted(set(EMBEDDERS) - {FakeEmbedder.name}))
+
+    parity_parser = subparsers.add_parser("parity", help="Cosine similarity and top-k overlap of an embedder against a reference.")
+    parity_parser.add_argument('--reference', type=str, default='instructor')
+    parity_parser.add_argument('--candidate', type=str, default='instructor-int8')
+    parity_parser.add_argument('--queries_file', type=str, default='./benchmarks/fixtures/queries.txt')
+    parity_parser.add_argument('--content_path', type=str, default='./documents/subsections.json')
+    parity_parser.add_argument('--n_documents', type=int, default=500)
+    parity_parser.add_argument('--top_k', type=int, default=10)
+
+    scheduler_parser = subparsers.add_parser("scheduler", help="Retries and invalid-input splitting of the OpenAI scheduler against a failing fake endpoint.")
+    scheduler_parser.add_argument('--n_texts', type=int, default=200)
+    scheduler_parser.add_argument('--batch_size', type=int, default=16)
+    scheduler_parser.add_argument('--rate_limit_rate', type=float, default=0.2)
+    scheduler_parser.add_argument('--error_rate', type=float, default=0.1)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="Offline end-to-end benchmark of parse, embed, index and query, against a baseline.")
+    pipeline_parser.add_argument('--pages_dir', type=str, default='./benchmarks/fixtures/pages')
+    pipeline_parser.add_argument('--queries_file', type=str, default='./benchmarks/fixtures/queries.txt')
+    pipeline_parser.add_argument('--embedder', type=str, default='fake')
+    pipeline_parser.add_argument('--copies', type=int, default=20)
+    pipeline_parser.add_argument('--top_k', type=int, default=10)
+    pipeline_parser.add_argument('--query_rounds', type=int, default=5)
+    pipeline_parser.add_argument('--output', type=str, default='./benchmarks/results.json')
+    pipeline_parser.add_argument('--baseline', type=str, default='./benchmarks/baseline.json')
+    pipeline_parser.add_argument('--tolerance', type=float, default=0.2, help="Relative slowdown reported as a regression.")
+    pipeline_parser.add_argument('--update_baseline', action='store_true')
+
+    args = parser.parse_args()
+    if args.benchmark == "preprocessing":
+        _, mismatches = bench_preprocessing(args.pages_dir, args.golden_dir, args.repeat, args.update_golden)
+        if mismatches:
+            print(f"Output differs from golden files for: {', '.join(mismatches)}")
+            sys.exit(1)
+    elif args.benchmark == "search":
+        bench_search(args.embeddings_path, args.content_path, args.n_queries, args.top_k)
+    elif args.benchmark == "startup":
+        report_startup_benchmark(args.embedders)
+    elif args.benchmark == "parity":
+        bench_parity(args.reference, args.candidate, args.queries_file, args.content_path, args.n_documents, args.top_k)
+    elif args.benchmark == "scheduler":
+        failures = check_openai_scheduler(args.n_texts, args.batch_size, args.rate_limit_rate, args.error_rate)
+        if failures:
+            print("\n".join(failures))
+            sys.exit(1)
+    elif args.benchmark == "pipeline":
+        results = bench_pipeline(args.pages_dir, args.queries_file, args.copies, args.top_k, args.query_rounds, args.embedder)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        baseline = {}
+        if os.path.exists(args.baseline) and not args.update_baseline:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+            if baseline.get("embedder") != results["embedder"] or baseline.get("n_points") != results["n_points"]:
+                print("Baseline was measured on another corpus or embedder, not comparing.")
+                baseline = {}
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        print(f"Results written to {args.output}")
+        if args.update_baseline:
+            with open(args.baseline, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"Baseline updated at {args.baseline}")
+        elif regressions:
+            print(f"Regressions against {args.baseline}: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,41 @@
+import argparse
+from tqdm import tqdm
+from utils.chunking import chunk_subsection
+from utils.subsections_io import iter_subsections, SubsectionWriter
+from utils.tokens import count_tokens
+
+def main(subsections_path, chunks_path, max_tokens, overlap, min_tokens):
+    """Split parsed subsections into token-bounded chunks, written as JSON lines.
+
+    Chunks are subsections themselves, keyed by '<url>#chunk-<index>', so embed.py and
+    create_index.py consume the chunks file like any subsections file.
+
+    Args:
+        subsections_path (str): Output of parse.py (.json or .jsonl).
+        chunks_path (str): Output .jsonl path.
+        max_tokens (int): Maximum number of tokens of a chunk.
+        overlap (int): Maximum number of tokens shared by consecutive chunks of a section.
+        min_tokens (int): Minimum size of a chunk before a heading starts a new one.
+    """
+    n_pages = 0
+    n_chunks = 0
+    n_tokens = 0
+    with SubsectionWriter(chunks_path) as writer:
+        for url, subsection in tqdm(iter_subsections(subsections_path)):
+            n_pages += 1
+            for chunk_id, chunk in chunk_subsection(url, subsection, max_tokens, overlap, min_tokens):
+                writer.write(chunk_id, chunk)
+                n_chunks += 1
+                n_tokens += count_tokens(chunk['content'])
+    print(f"Split {n_pages} pages into {n_chunks} chunks ({n_tokens / max(n_chunks, 1):.0f} tokens on average).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subsections_path', type=str, default='./documents/subsections.json')
+    parser.add_argument('--chunks_path', type=str, default='./documents/chunks.jsonl')
+    parser.add_argument('--max_tokens', type=int, default=300)
+    parser.add_argument('--overlap', type=int, default=50)
+    parser.add_argument('--min_tokens', type=int, default=64)
+    args = parser.parse_args()
+    main(args.subsections_path, args.chunks_path, args.max_tokens, args.overlap, args.min_tokens)
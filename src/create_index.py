@@ -1,85 +1,330 @@
 import qdrant_client as qc
 import qdrant_client.http.models as qmodels
 import uuid
-import json
 import argparse
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+from utils.subsections_io import iter_subsections
+from utils.embedding_store import EmbeddingStore
+from utils.embedders import get_embedder
+from utils.chunking import chunk_id
+from utils.lexical import DEFAULT_LEXICAL_INDEX_PATH, build_lexical_index
+from utils import metrics
+from utils.parsing_preprocessing import extract_doc_area_from_url, extract_version_from_url
+from utils.qdrant_config import collection_params, load_config, merge_config
+from utils.qdrant_collections import (
+    check_alias_free, collection_exists, delete_old_versions, resolve_collection_name, switch_alias, versioned_collection_name
+)
 
 client = qc.QdrantClient(url="localhost")
 METRIC = qmodels.Distance.DOT
 COLLECTION_NAME = "ue5_docs"
+# payload fields filtered on by query_index.py
+PAYLOAD_INDEXES = ("block_type", "version", "doc_area")
 
-def create_index():
+def create_index(recreate=False, collection_name=COLLECTION_NAME, config=None):
+    """Create the collection. An existing collection is kept, unless `recreate` is set,
+    so that re-ingesting only touches the points that changed.
+
+    HNSW, quantization, on-disk storage and optimizer settings come from the "collection"
+    section of `config` (see utils/qdrant_config.py). They only apply when the collection
+    is created: use `recreate` or a blue/green build to change them.
+    """
+    if collection_exists(client, collection_name) and not recreate:
+        vectors_config = client.get_collection(collection_name).config.params.vectors
+        if vectors_config.size == DIMENSION:
+            create_payload_indexes(collection_name)
+            return
+        print(f"Collection {collection_name} has dimension {vectors_config.size}, not {DIMENSION}. Recreating it.")
     client.recreate_collection(
-    collection_name=COLLECTION_NAME,
-    vectors_config = qmodels.VectorParams(
-            size=DIMENSION,
-            distance=METRIC,
-        )
+        collection_name=collection_name,
+        **collection_params(config or load_config(), DIMENSION, METRIC)
     )
+    create_payload_indexes(collection_name)
+
+
+def create_payload_indexes(collection_name=COLLECTION_NAME):
+    """Create the keyword payload indexes used by filtered searches, if missing."""
+    payload_schema = client.get_collection(collection_name).payload_schema
+    for field_name in PAYLOAD_INDEXES:
+        if field_name not in payload_schema:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=qmodels.PayloadSchemaType.KEYWORD,
+            )
 
 
 def create_subsection_vector(
     subsection_content,
     section_anchor,
-    page_url
+    page_url,
+    chunk_index=None,
+    offset=None,
+    key=None
     ):
 
-    id = str(uuid.uuid1().int)[:32]
+    # ids derive from the url (and chunk index), so re-ingesting a page overwrites its points
+    if chunk_index is None:
+        id = str(uuid.uuid5(uuid.NAMESPACE_URL, page_url))
+    else:
+        id = str(uuid.uuid5(uuid.NAMESPACE_URL, chunk_id(page_url, chunk_index)))
     payload = {
         "text": subsection_content,
         "url": page_url,
         "section_anchor": section_anchor,
-        "block_type": 'text'
+        "block_type": 'text',
+        "version": extract_version_from_url(page_url),
+        "doc_area": extract_doc_area_from_url(page_url),
+        "key": key
     }
+    # chunks produced by chunk.py also record where they come from in the page
+    if chunk_index is not None:
+        payload["chunk_index"] = chunk_index
+        payload["offset"] = offset
     return id, payload
 
 
-def add_doc_to_index(embeddings, content_dict):
-    ids = []
-    vectors = []
-    payloads = []
-    
-    for url, content in tqdm(embeddings.items()):
-        section_anchor = content['title']
-        section_vector = content['embedding']
-        section_content = content_dict[url]['content']
-        id, payload = create_subsection_vector(
-            section_content,
-            section_anchor,
-            url
-    )
-        ids.append(id)
-        vectors.append(section_vector)
-        payloads.append(payload)
+def get_indexed_keys(collection_name=COLLECTION_NAME):
+    """Return the content key and the engine version of every point already in the collection, by point id.
 
-        # Add vectors to collection
+    Returns:
+        tuple: (point id -> content key, point id -> version).
+    """
+    indexed_keys = {}
+    indexed_versions = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=1000,
+            offset=offset,
+            with_payload=["key", "version", "url", "doc_area"],
+            with_vectors=False
+        )
+        for point in points:
+            # points ingested before the version field existed, or with an outdated doc_area, are upserted again
+            up_to_date = (
+                "version" in point.payload
+                and point.payload.get("doc_area") == extract_doc_area_from_url(point.payload.get("url", ""))
+            )
+            indexed_keys[str(point.id)] = point.payload.get("key") if up_to_date else None
+            indexed_versions[str(point.id)] = point.payload.get("version")
+        if offset is None:
+            return indexed_keys, indexed_versions
+
+
+def upsert_batch(collection_name, ids, vectors, payloads):
+    with metrics.span("create_index.upsert"):
         client.upsert(
-            collection_name=COLLECTION_NAME,
+            collection_name=collection_name,
             points=qmodels.Batch(
-                ids = [id],
-                vectors=[section_vector],
-                payloads=[payload]
+                ids=ids,
+                vectors=vectors,
+                payloads=payloads
             ),
         )
+    metrics.increment("points_upserted", len(ids))
+    return len(ids)
+
+
+@metrics.timed("create_index.add_doc_to_index")
+def add_doc_to_index(embeddings, subsections, batch_size=256, parallel=4, collection_name=COLLECTION_NAME, prune=False):
+    """Upsert the embedded subsections to the collection.
+
+    Points whose content key did not change since the last ingestion are skipped. With
+    `prune`, points of the engine versions present in `subsections` that are not part of
+    them anymore are deleted; points of other versions are always kept, so versions can
+    be ingested one file at a time.
+
+    Args:
+        embeddings (EmbeddingStore): Embeddings of the subsections.
+        subsections (iterable): (url, subsection) pairs, e.g. from iter_subsections.
+        batch_size (int): Number of points per upsert request.
+        parallel (int): Number of upsert requests in flight.
+        collection_name (str): Collection (or alias) to ingest into.
+        prune (bool): Delete the points of removed pages of the ingested versions.
+
+    Returns:
+        int: Number of points of the subsections in the collection.
+    """
+    indexed_keys, indexed_versions = get_indexed_keys(collection_name)
+    seen_ids = set()
+    seen_versions = set()
+    n_skipped = 0
+    n_upserted = 0
+    ids = []
+    vectors = []
+    payloads = []
+    in_flight = deque()
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        def submit():
+            nonlocal ids, vectors, payloads, n_upserted
+            # bound the number of batches held in memory
+            while len(in_flight) >= 2 * parallel:
+                n_upserted += in_flight.popleft().result()
+            in_flight.append(executor.submit(upsert_batch, collection_name, ids, vectors, payloads))
+            ids, vectors, payloads = [], [], []
+
+        # subsections are consumed lazily, e.g. from iter_subsections
+        for url, subsection in tqdm(subsections):
+            # vectors are read straight from the memory-mapped store
+            content = embeddings.get(url)
+            if content is None:
+                continue
+            section_anchor, section_vector = content
+            section_content = subsection['content']
+            id, payload = create_subsection_vector(
+                section_content,
+                subsection.get('section_anchor', section_anchor),
+                subsection.get('page_url', url),
+                chunk_index=subsection.get('chunk_index'),
+                offset=subsection.get('offset'),
+                key=embeddings.key(url)
+            )
+            seen_ids.add(id)
+            seen_versions.add(payload["version"])
+            if payload["key"] is not None and indexed_keys.get(id) == payload["key"]:
+                n_skipped += 1
+                metrics.increment("points_skipped")
+                continue
+            ids.append(id)
+            vectors.append(section_vector.tolist())
+            payloads.append(payload)
+            if len(ids) == batch_size:
+                submit()
+        if ids:
+            submit()
+        while in_flight:
+            n_upserted += in_flight.popleft().result()
+
+    stale_ids = []
+    if prune:
+        stale_ids = [id for id in indexed_keys if id not in seen_ids and indexed_versions[id] in seen_versions]
+    if stale_ids:
+        metrics.increment("points_deleted", len(stale_ids))
+        client.delete(
+            collection_name=collection_name,
+            points_selector=qmodels.PointIdsList(points=stale_ids),
+        )
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Upserted {n_upserted} points in {elapsed:.1f}s ({n_upserted / elapsed:.1f} points/sec), "
+          f"skipped {n_skipped} unchanged points, deleted {len(stale_ids)} stale points.")
+    return len(seen_ids)
+
+
+def validate_collection(collection_name, expected_count):
+    """Check that a freshly built collection is complete and searchable.
+
+    Args:
+        collection_name (str): Collection to check.
+        expected_count (int): Number of points it should hold.
+
+    Raises:
+        RuntimeError: If the collection is incomplete or a stored vector does not find itself.
+    """
+    count = client.count(collection_name=collection_name, exact=True).count
+    if count != expected_count:
+        raise RuntimeError(f"Collection {collection_name} holds {count} points, expected {expected_count}.")
+    if count == 0:
+        return
+    (probe,), _ = client.scroll(collection_name=collection_name, limit=1, with_payload=False, with_vectors=True)
+    hits = client.search(collection_name=collection_name, query_vector=probe.vector, limit=10, with_payload=False)
+    if probe.id not in [hit.id for hit in hits]:
+        raise RuntimeError(f"Collection {collection_name} does not return a stored vector among its nearest neighbours.")
+
+
+def build_blue_green(embeddings, subsections, batch_size=256, parallel=4, keep_versions=1, config=None, migrate=False):
+    """Build a new version of the collection next to the live one, then switch the alias to it.
+
+    Queries keep hitting the previous version through the alias until the new one is
+    complete and validated. Older versions beyond `keep_versions` are deleted.
+
+    Args:
+        embeddings (EmbeddingStore): Embeddings of the subsections.
+        subsections (iterable): (url, subsection) pairs, e.g. from iter_subsections.
+        batch_size (int): Number of points per upsert request.
+        parallel (int): Number of upsert requests in flight.
+        keep_versions (int): Number of previous versions kept for rollback.
+        config (dict, optional): Qdrant configuration of the new collection.
+        migrate (bool): Replace a plain collection named like the alias, built before aliases were used.
+    """
+    # fail before building anything rather than at the switch
+    check_alias_free(client, COLLECTION_NAME, migrate)
+    collection_name = versioned_collection_name(COLLECTION_NAME)
+    if collection_exists(client, collection_name):
+        raise RuntimeError(f"Collection {collection_name} already exists, another build is running.")
+    print(f"Building {collection_name}.")
+    create_index(recreate=True, collection_name=collection_name, config=config)
+    expected_count = add_doc_to_index(embeddings, subsections, batch_size, parallel, collection_name)
+    validate_collection(collection_name, expected_count)
+    switch_alias(client, COLLECTION_NAME, collection_name, migrate)
+    print(f"Alias {COLLECTION_NAME} now points to {collection_name}.")
+    for name in delete_old_versions(client, COLLECTION_NAME, keep=keep_versions):
+        print(f"Deleted old version {name}.")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--embedder', type=str, default='instructor')
-    parser.add_argument('--embeddings_path', type=str, default='./embeddings/instructor_embeddings.json')
+    parser.add_argument('--embeddings_path', type=str, default='./embeddings/instructor_embeddings')
     parser.add_argument('--content_path', type=str, default='./documents/subsections.json')
+    parser.add_argument('--batch_size', type=int, default=256, help="Points per upsert request.")
+    parser.add_argument('--parallel', type=int, default=4, help="Upsert requests in flight.")
+    parser.add_argument('--recreate', action='store_true', help="Drop and recreate the collection before ingesting.")
+    parser.add_argument('--prune', action='store_true', help="Delete points of pages missing from --content_path, for the versions it holds.")
+    parser.add_argument('--blue_green', action='store_true', help="Build a new collection version and switch the alias to it once validated.")
+    parser.add_argument('--migrate_to_alias', action='store_true', help="With --blue_green, replace a plain ue5_docs collection by the alias. Queries fail for a moment.")
+    parser.add_argument('--keep_versions', type=int, default=1, help="Previous versions kept after a blue/green build.")
+    parser.add_argument('--lexical_index_path', type=str, default=DEFAULT_LEXICAL_INDEX_PATH, help="BM25 index built next to the collection.")
+    parser.add_argument('--no_lexical_index', action='store_true', help="Do not build the BM25 lexical index.")
+    parser.add_argument('--config', type=str, default=None, help="Qdrant json config. Defaults to $UE5_DOCS_QDRANT_CONFIG or ./config/qdrant.json.")
+    parser.add_argument('--hnsw_m', type=int, default=None, help="Edges per node of the HNSW graph.")
+    parser.add_argument('--hnsw_ef_construct', type=int, default=None, help="Candidates considered while building the HNSW graph.")
+    parser.add_argument('--quantization', type=str, default=None, choices=['none', 'scalar', 'product'])
+    parser.add_argument('--quantile', type=float, default=None, help="Quantile of the scalar quantization bounds.")
+    parser.add_argument('--pq_compression', type=str, default=None, choices=['x4', 'x8', 'x16', 'x32', 'x64'])
+    parser.add_argument('--quantized_on_disk', action='store_true', help="Do not pin quantized vectors in RAM.")
+    parser.add_argument('--on_disk_vectors', action='store_true', default=None, help="Store original vectors on disk (memmap).")
+    parser.add_argument('--on_disk_payload', action='store_true', default=None, help="Store payloads on disk.")
+    parser.add_argument('--memmap_threshold', type=int, default=None, help="Segment size (kB) above which vectors are memory-mapped.")
+    parser.add_argument('--indexing_threshold', type=int, default=None, help="Segment size (kB) above which the HNSW index is built.")
     args = parser.parse_args()
 
-    if args.embedder == 'openai':
-        DIMENSION = 1536
-    else:
-        DIMENSION = 768
+    quantization = None
+    if args.quantization == 'scalar':
+        quantization = {"type": "scalar", "quantile": args.quantile, "always_ram": not args.quantized_on_disk}
+    elif args.quantization == 'product':
+        quantization = {"type": "product", "compression": args.pq_compression or "x16", "always_ram": not args.quantized_on_disk}
+    config = merge_config(load_config(args.config), {"collection": {
+        "hnsw": {"m": args.hnsw_m, "ef_construct": args.hnsw_ef_construct},
+        "quantization": quantization,
+        "on_disk_vectors": args.on_disk_vectors,
+        "on_disk_payload": args.on_disk_payload,
+        "optimizers": {"memmap_threshold": args.memmap_threshold, "indexing_threshold": args.indexing_threshold},
+    }})
+    if args.quantization == 'none':
+        config["collection"]["quantization"] = None
+
+    DIMENSION = get_embedder(args.embedder).dimension
     
-    with open(args.embeddings_path, 'r') as f:
-        embeddings = json.load(f)
-    with open(args.content_path, 'r') as f:
-        content_dict = json.load(f)
+    embeddings = EmbeddingStore(args.embeddings_path)
+    if not embeddings.exists():
+        raise FileNotFoundError(f"No embedding store at {embeddings.prefix}. Run embed.py, or convert json embeddings with src/utils/embedding_store.py")
     
-    create_index()
-    add_doc_to_index(embeddings, content_dict)
\ No newline at end of file
+    if args.blue_green:
+        build_blue_green(embeddings, iter_subsections(args.content_path), args.batch_size, args.parallel, args.keep_versions, config, args.migrate_to_alias)
+    else:
+        # update the live collection in place, through the alias if there is one
+        collection_name = resolve_collection_name(client, COLLECTION_NAME)
+        create_index(recreate=args.recreate, collection_name=collection_name, config=config)
+        add_doc_to_index(embeddings, iter_subsections(args.content_path), args.batch_size, args.parallel, collection_name, args.prune)
+
+    if not args.no_lexical_index:
+        lexical_index = build_lexical_index(args.content_path, args.lexical_index_path)
+        print(f"Built the lexical index of {len(lexical_index)} subsections at {args.lexical_index_path}")
@@ -1,129 +1,197 @@
-import openai
-from openai.error import InvalidRequestError
-from InstructorEmbedding import INSTRUCTOR
-import torch
-import glob
 import argparse
-import pickle
-import json
 import os
+import time
 from tqdm import tqdm
-
-def embed(subsection_dict_path, embedder, security):
+from utils.subsections_io import iter_subsections
+from utils.tokens import count_tokens
+from utils.embedding_store import EmbeddingStore, content_key, convert_json_embeddings
+from utils.embedders import CPU_THREADS_ENV, get_embedder
+from utils.chunking import split_chunk_id
+from utils.parsing_preprocessing import extract_version_from_url
+from utils import metrics
+
+def eviction_scope(url):
+    """Part of the store an input file covers: the engine version of the page, and whether it holds chunks."""
+    page_url, chunk_index = split_chunk_id(url)
+    return extract_version_from_url(page_url), chunk_index is not None
+
+
+@metrics.timed("embed.embed")
+def embed(subsection_dict_path, embedder, security, batch_size=32, openai_options=None, embeddings_path=None):
     """Embed the files in the directory.
 
     Args:
-        subsection_dict_path (dict): Path to the dictionary containing the subsections.
+        subsection_dict_path (str): Path to the subsections (.json or streamed .jsonl).
         security (str): Security setting. Either "activated" or "deactivated".
                         prevents the function from running if not "deactivated" 
                         and avoids unexpected costs.
+        batch_size (int): Number of texts sent to the embedder at once.
+        openai_options (dict, optional): Keyword arguments of OpenAIEmbeddingScheduler
+                                         (max_concurrency, requests_per_minute, tokens_per_minute, ...).
+        embeddings_path (str, optional): Prefix of the embedding store. Defaults to ./embeddings/<embedder>_embeddings.
 
     Returns:
-        embeddings (dict): Dictionary containing the embeddings.
+        embeddings (EmbeddingStore): Store containing the embeddings.
     """
 
     # If embeddings already exist, load them
-    if os.path.exists(os.path.join("./embeddings", f'{embedder}_embeddings.json')):
+    embeddings = EmbeddingStore(embeddings_path or os.path.join("./embeddings", f'{embedder}_embeddings'))
+    legacy_path = embeddings.prefix + ".json"
+    if embeddings.exists():
         print("Embeddings already exist. Loading them.")
-        with open(os.path.join("./embeddings", f'{embedder}_embeddings.json'), 'r') as f:
-            embeddings = json.load(f)
-
-    else:
-        # initialize dictionary to store embeddings
-        embeddings = {}
+    elif os.path.exists(legacy_path):
+        print("Json embeddings already exist. Converting them to the binary store.")
+        embeddings = convert_json_embeddings(legacy_path)
 
     # check security if embedder is openai
     if security != "deactivated":
         if embedder == 'openai':
             raise Exception("Security is not deactivated.")
     
-    # load subsections
-    with open(subsection_dict_path, 'r') as f:
-        subsection_dict = json.load(f)
-
-
     # For debugging purposes only
     # Compute average text length to embed
-    dict_len = len(subsection_dict)
+    # subsections are streamed from disk rather than loaded at once
+    dict_len = 0
     total_text_len = 0
-    for url, subsection in subsection_dict.items():
+    for url, subsection in iter_subsections(subsection_dict_path):
+        dict_len += 1
         total_text_len += len(subsection['content'])
     avg_text_len = total_text_len / dict_len
 
-    # initialize openai api if embedder is 'openai'
-    if embedder == "openai":
-        openai_model = "text-embedding-ada-002"
-        # Fetch API key from environment variable or prompt user for it
-        api_key = os.getenv('API_KEY')
-        if api_key is None:
-            api_key = input("Please enter your OpenAI API key: ")
-        openai.api_key = api_key
-
-    # initialize instructor model if embedder is 'instructor'
-    elif embedder == "instructor":
-        instructor_model = INSTRUCTOR('hkunlp/instructor-xl')
-
-        # set device to gpu if available
-        if (torch.backends.mps.is_available()) and (torch.backends.mps.is_built()):
-            device = torch.device("mps")
-        elif torch.cuda.is_available():
-            device = torch.device("cuda")
-        else:
-            device = torch.device("cpu")
-
-    else:
-        raise ValueError(f"Embedder must be 'openai' or 'instructor'. Not {embedder}")
-    
-    # loop through subsections
-    for url, subsection in tqdm(subsection_dict.items()):
-        subsection_name = subsection['title']
-        text_to_embed = subsection['content']
-
-        # skip if already embedded
-        if url in embeddings.keys():
+    # raises on unknown embedders; the model is only loaded if something needs embedding
+    backend = get_embedder(embedder)
+    model_name, instruction = backend.model, backend.document_instruction
+    batch_size = min(batch_size, backend.max_batch_size)
+
+    # collect subsections that still need an embedding.
+    # vectors are cached by content key, so unchanged texts are never re-embedded,
+    # even if their url changed, and changing the model or instruction invalidates them.
+    key_to_row = {
+        record["key"]: row for row, record in enumerate(embeddings.rows) if record.get("key") is not None
+    }
+    corpus_keys = {}
+    to_embed = []
+    # other (url, title) of a text already queued, which get its embedding
+    duplicates = {}
+    n_reused = 0
+    n_adopted = 0
+    for url, subsection in iter_subsections(subsection_dict_path):
+        key = content_key(embedder, model_name, instruction, subsection['content'])
+        corpus_keys[url] = key
+        row = embeddings.url_to_row.get(url)
+        if row is not None and row < embeddings.count:
+            record = embeddings.rows[row]
+            # skip if already embedded
+            if record.get("key") == key:
+                continue
+            if record.get("key") is None:
+                # embedded before content keys existed: trust it once rather than pay again
+                record["key"] = key
+                n_adopted += 1
+                continue
+        if key in key_to_row:
+            # same content under another url
+            embeddings.add(url, subsection['title'], embeddings.vectors()[key_to_row[key]], key=key)
+            n_reused += 1
             continue
-
-        # make request for embedding
-        # case 1: openai
-        if embedder == 'openai':
-            try:
-                response = openai.Embedding.create(
-                    input=text_to_embed,
-                    model=openai_model
-                )
-                embedding = response['data'][0]['embedding']
-
-            except InvalidRequestError as e:
+        if key in duplicates:
+            # same content under another url in this run: embed it once
+            duplicates[key].append((url, subsection['title']))
+            n_reused += 1
+            continue
+        duplicates[key] = []
+        to_embed.append((url, subsection['title'], subsection['content'], key))
+    print(f"{len(to_embed)} subsections to embed, {n_reused} vectors reused from moved or duplicated content, "
+          f"{len(corpus_keys) - len(to_embed) - n_reused} unchanged.")
+
+    if to_embed:
+        backend.load()
+    # openai requests go through the rate-limit-aware scheduler
+    if embedder == "openai" and to_embed:
+        from utils.openai_scheduler import OpenAIEmbeddingScheduler
+        scheduler = OpenAIEmbeddingScheduler(model_name, **(openai_options or {}))
+
+    # sort by length so that each batch holds texts of similar size and
+    # the transformer wastes as little compute as possible on padding
+    to_embed.sort(key=lambda item: len(item[2]))
+    batches = [to_embed[i:i + batch_size] for i in range(0, len(to_embed), batch_size)]
+
+    n_texts = 0
+    n_tokens = 0
+    last_checkpoint = len(embeddings)
+    progress_bar = tqdm(total=len(to_embed))
+
+    def store_batch(batch, batch_embeddings, errors):
+        nonlocal n_texts, n_tokens, last_checkpoint
+        # map embeddings back to their urls
+        for (url, subsection_name, text_to_embed, key), embedding, error in zip(batch, batch_embeddings, errors):
+            if embedding is None:
                 print(f"Error with url {url}")
                 print('The server couldn\'t fulfill the request.')
-                print('Error code: ', e.code)
+                print('Error code: ', error.code)
                 print(f'Tried to embed {len(text_to_embed)} characters while average is {avg_text_len}')
                 continue
+            embeddings.add(url, subsection_name, embedding, key=key)
+            for duplicate_url, duplicate_name in duplicates[key]:
+                embeddings.add(duplicate_url, duplicate_name, embedding, key=key)
+            n_texts += 1
+            tokens = count_tokens(text_to_embed)
+            n_tokens += tokens
+            metrics.increment("texts_embedded")
+            metrics.increment("tokens_embedded", tokens)
+        progress_bar.update(len(batch))
+
+        # append new embeddings to the store every 100 new embeddings
+        if len(embeddings) - last_checkpoint >= 100:
+            last_checkpoint = len(embeddings)
+            print(f"Saving embeddings after {len(embeddings)} iterations.")
+            embeddings.flush()
 
-        # case 2: instructor
-        elif embedder == 'instructor':
-            instruction = "Represent the UnrealEngine documentation for retrieval:"
-            embedding = instructor_model.encode([[instruction, text_to_embed]], device=device)
-            embedding = [float(x) for x in embedding.squeeze().tolist()]
+    start_time = time.perf_counter()
+    try:
+        # make requests for embeddings
+        # case 1: openai, several batched requests in flight within the rate limits
+        if embedder == 'openai':
+            scheduler.embed_batches(
+                [[(item, item[2]) for item in batch] for batch in batches],
+                lambda batch, batch_embeddings, errors: store_batch([item for item, _ in batch], batch_embeddings, errors)
+            )
 
+        # case 2: local models, one batch at a time
         else:
-            raise ValueError(f"Embedder must be 'openai' or 'instructor'. Not {embedder}")
-        
-        # add embedding to dictionary
-        embeddings[url] = {
-            "title": subsection_name,
-            "embedding": embedding
-        }
-
-        # save dictionary every 100 iterations
-        if len(embeddings) % 100 == 0:
-            print(f"Saving embeddings after {len(embeddings)} iterations.")
-            # save embeddings to pickle file
-            with open(os.path.join("./embeddings", f'{embedder}_embeddings.pkl'), 'wb') as f:
-                pickle.dump(embeddings, f)
-            # save embeddings to json file
-            with open(os.path.join("./embeddings", f'{embedder}_embeddings.json'), 'w') as f:
-                json.dump(embeddings, f)
+            for batch in batches:
+                with metrics.span("embed.encode"):
+                    batch_embeddings = backend.embed_documents([text for _, _, text, _ in batch])
+                store_batch(batch, batch_embeddings, [None] * len(batch))
+    finally:
+        # keep whatever was embedded before a failure
+        progress_bar.close()
+        embeddings.flush()
+
+    elapsed = time.perf_counter() - start_time
+    if n_texts > 0:
+        print(f"Embedded {n_texts} texts ({n_tokens} tokens) in {elapsed:.1f}s: "
+              f"{n_texts / elapsed:.2f} texts/sec, {n_tokens / elapsed:.1f} tokens/sec (batch size {batch_size}).")
+
+    # evict vectors of pages that changed or left the corpus. The store may also hold other
+    # versions or the chunks of the same pages, embedded from other files: pages missing
+    # from this file are only evicted among the versions and kind (pages or chunks) it holds
+    embeddings.flush()
+    corpus_scopes = {eviction_scope(url) for url in corpus_keys}
+
+    def keep(row, record):
+        url = record["url"]
+        if embeddings.url_to_row[url] != row:
+            return False
+        if url in corpus_keys:
+            return record.get("key") == corpus_keys[url]
+        return eviction_scope(url) not in corpus_scopes
+
+    keep_rows = [row for row, record in enumerate(embeddings.rows) if keep(row, record)]
+    if len(keep_rows) < embeddings.count:
+        print(f"Evicting {embeddings.count - len(keep_rows)} stale embeddings.")
+    if len(keep_rows) < embeddings.count or n_adopted > 0:
+        embeddings.compact(keep_rows)
 
     return embeddings
 
@@ -132,13 +200,26 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--embedder', type=str, default='instructor')
     parser.add_argument('--subsections_path', type=str, default='./documents/subsections.json')
+    parser.add_argument('--embeddings_path', type=str, default=None, help="Embedding store. Defaults to ./embeddings/<embedder>_embeddings.")
     parser.add_argument('--security', type=str, default='activated')
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--max_concurrency', type=int, default=4, help="OpenAI requests in flight.")
+    parser.add_argument('--requests_per_minute', type=int, default=3000, help="OpenAI requests/min budget.")
+    parser.add_argument('--tokens_per_minute', type=int, default=1000000, help="OpenAI tokens/min budget.")
+    parser.add_argument('--api_base', type=str, default=None, help="OpenAI api base url, e.g. the one of fake_embeddings_server.py.")
+    parser.add_argument('--cpu_threads', type=int, default=None, help="Torch threads of the instructor-int8 embedder.")
     args = parser.parse_args()
-    embeddings = embed(args.subsections_path, args.embedder, args.security)
-    # save embeddings to pickle file
-    with open(os.path.join("./embeddings", f'{args.embedder}_embeddings.pkl'), 'wb') as f:
-        pickle.dump(embeddings, f)
-    # save embeddings to json file
-    with open(os.path.join("./embeddings", f'{args.embedder}_embeddings.json'), 'w') as f:
-        json.dump(embeddings, f)
+    if args.cpu_threads is not None:
+        os.environ[CPU_THREADS_ENV] = str(args.cpu_threads)
+    if args.api_base is not None:
+        import openai
+        openai.api_base = args.api_base
+    openai_options = {
+        "max_concurrency": args.max_concurrency,
+        "requests_per_minute": args.requests_per_minute,
+        "tokens_per_minute": args.tokens_per_minute,
+    }
+    embeddings = embed(args.subsections_path, args.embedder, args.security, batch_size=args.batch_size, openai_options=openai_options, embeddings_path=args.embeddings_path)
+    # append remaining embeddings to the store
+    embeddings.flush()
 
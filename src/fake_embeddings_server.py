@@ -0,0 +1,111 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.tokens import TOKEN_PATTERN
+
+
+def fake_embedding(text, dim=1536):
+    """Deterministic, unit-norm pseudo-embedding of a text.
+
+    Tokens are hashed into signed buckets (feature hashing), so texts sharing
+    words get similar vectors and retrieval on fake embeddings still behaves
+    sensibly in tests and benchmarks.
+
+    Args:
+        text (str): Text to embed.
+        dim (int): Dimension of the embedding.
+
+    Returns:
+        list of float: The embedding.
+    """
+    embedding = [0.0] * dim
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        digest = hashlib.md5(token.encode('utf-8')).digest()
+        bucket = int.from_bytes(digest[:4], 'little') % dim
+        embedding[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in embedding))
+    if norm == 0:
+        return embedding
+    return [x / norm for x in embedding]
+
+
+class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+    """Serves POST <any prefix>/embeddings like the OpenAI embeddings endpoint."""
+    dim = 1536
+    max_tokens = 8191
+    rate_limit_rate = 0.0
+    error_rate = 0.0
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status, error_type, message, headers=None):
+        self._send_json(status, {"error": {"message": message, "type": error_type, "param": None, "code": None}}, headers)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith("/embeddings"):
+            self._send_error(404, "invalid_request_error", f"Unknown path {self.path}")
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+        # inject the failures the scheduler has to survive
+        draw = random.random()
+        if draw < self.rate_limit_rate:
+            self._send_error(429, "requests", "Rate limit reached", headers={"Retry-After": "0.1"})
+            return
+        if draw < self.rate_limit_rate + self.error_rate:
+            self._send_error(500, "server_error", "The server had an error while processing your request")
+            return
+
+        inputs = request["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        n_tokens = [len(TOKEN_PATTERN.findall(text)) for text in inputs]
+        if max(n_tokens, default=0) > self.max_tokens:
+            self._send_error(400, "invalid_request_error", f"This model's maximum context length is {self.max_tokens} tokens")
+            return
+
+        self._send_json(200, {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, self.dim)}
+                for i, text in enumerate(inputs)
+            ],
+            "model": request.get("model"),
+            "usage": {"prompt_tokens": sum(n_tokens), "total_tokens": sum(n_tokens)},
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeEmbeddingsServer(ThreadingHTTPServer):
+    # the default listen backlog of 5 refuses bursts of concurrent clients
+    request_queue_size = 128
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake of the OpenAI embeddings endpoint.")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--max_tokens', type=int, default=8191)
+    parser.add_argument('--rate_limit_rate', type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument('--error_rate', type=float, default=0.0, help="Fraction of requests answered with 500.")
+    args = parser.parse_args()
+    FakeEmbeddingsHandler.dim = args.dim
+    FakeEmbeddingsHandler.max_tokens = args.max_tokens
+    FakeEmbeddingsHandler.rate_limit_rate = args.rate_limit_rate
+    FakeEmbeddingsHandler.error_rate = args.error_rate
+    server = FakeEmbeddingsServer(("localhost", args.port), FakeEmbeddingsHandler)
+    print(f"Fake embeddings endpoint on http://localhost:{args.port}/v1")
+    server.serve_forever()
@@ -1,52 +1,169 @@
-import urllib.request
 from urllib.error import URLError, HTTPError
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from importlib.metadata import version as package_version
 from markdownify import markdownify as md
+import hashlib
+import inspect
 import json
-from utils.parsing_preprocessing import split_text_into_components, extract_info_from_url
+import os
+from utils import parsing_preprocessing
+from utils.parsing_preprocessing import split_text_into_components, extract_info_from_url, with_version
+from utils.fetching import Fetcher
+from utils.http_cache import HttpCache
+from utils.subsections_io import is_jsonl, iter_subsections, load_subsections, SubsectionWriter
+from utils import metrics
 
-def main(limit, urls_registry, subsections_path):
-    urls_registry = "./src/utils/urls.txt"
+def parse_page(url, content):
+    """Convert a raw documentation page to a subsection. Runs in the parsing worker processes.
+
+    Args:
+        url (str): Url of the page.
+        content (bytes): Raw html of the page.
+
+    Returns:
+        tuple: (subsection title, cleaned text of the page).
+    """
+    # parse content
+    with metrics.span("parse.markdownify"):
+        md_content = md(content.decode('utf-8'))
+    with metrics.span("parse.clean"):
+        preproc_content = split_text_into_components(md_content)
+    # extract info from url name
+    subsection_title = extract_info_from_url(url)
+    return subsection_title, preproc_content
+
+
+def parser_version():
+    """Hash of the code turning a page into cleaned text: parse_page, the preprocessing module and markdownify.
+
+    The cleaned text of cached pages is stored under it, so pages are parsed again
+    whenever the cleaning rules change, even if their html did not.
+    """
+    with open(parsing_preprocessing.__file__, 'rb') as f:
+        source = f.read()
+    source += inspect.getsource(parse_page).encode('utf-8') + package_version("markdownify").encode('utf-8')
+    return hashlib.sha256(source).hexdigest()[:16]
+
+
+@metrics.timed("parse.main")
+def main(limit, urls_registry, subsections_path, concurrency=8, rate_limit=10.0, retries=3, cache_dir=None, parse_workers=None, resume=False, versions=None):
     with open(urls_registry, 'r') as f:
         urls = f.read()
     urls = urls.split('\n')
+    # the registry lists the pages of one version: crawl the same pages for every requested version
+    if versions:
+        urls = [with_version(url, version) for version in versions for url in urls if url]
+
+    # stop if limit is reached
+    if limit is not None:
+        urls = urls[:limit + 1]
+
+    # .jsonl outputs are streamed, one record per page, as soon as it is parsed
+    stream = is_jsonl(subsections_path)
+    resume = resume and os.path.exists(subsections_path)
+    existing = {}
+    if resume:
+        # a streamed output only needs its urls, a json output is rewritten whole at the end
+        if stream:
+            existing = {url: None for url, _ in iter_subsections(subsections_path)}
+        else:
+            existing = load_subsections(subsections_path)
+        print(f"Resuming: skipping {len(existing)} already parsed urls")
+        urls = [url for url in urls if url not in existing]
+
+    fetcher = Fetcher(
+        concurrency=concurrency,
+        rate_limit=rate_limit,
+        retries=retries
+    )
+    # conditional requests against the on-disk cache, if enabled
+    cache = HttpCache(cache_dir, parser_version()) if cache_dir is not None else None
+    headers = cache.conditional_headers if cache is not None else None
+    n_changed, n_unchanged, n_failed = 0, 0, 0
 
     # initialize dictionary to store subsections
-    subsections = {}
-    for idx, url in enumerate(urls):
-        # stop if limit is reached
-        if limit is not None:
-            if idx > limit:
-                break
-        if idx % 100 == 0:
-            print(f"Processing url {idx}")
-
-        # make request
-        try:
-            with urllib.request.urlopen(url) as f:
-                content = f.read()
-        except HTTPError as e:
-            print(f"Error with url {url}")
-            print('The server couldn\'t fulfill the request.')
-            print('Error code: ', e.code)
-            continue
-        except URLError as e:
-            print(f"Error with url {url}")
-            print('We failed to reach a server.')
-            print('Reason: ', e.reason)
-            continue
-        # parse content
-        md_content = md(content.decode('utf-8'))
-        preproc_content = split_text_into_components(md_content)
-        # extract info from url name
-        subsection_title = extract_info_from_url(url)
-        # add to dictionary
-        subsections[url] = {
-            "title": subsection_title,
-            "content": preproc_content
-        }
-    # save dictionary
-    with open(subsections_path, 'w') as f:
-        json.dump(subsections, f)
+    subsections = {} if stream else existing
+    writer = SubsectionWriter(subsections_path, resume=resume) if stream else None
+    # pages waiting to be parsed, in registry order: (url, future, cached subsection)
+    pending = deque()
+
+    def collect(wait):
+        # move parsed pages to the output, stopping at the first unfinished one
+        while pending and (wait or pending[0][1] is None or pending[0][1].done()):
+            url, future, subsection = pending.popleft()
+            if future is not None:
+                subsection = future.result()
+                # spans of the parsing workers come back with their result
+                if metrics.enabled():
+                    subsection, snapshot = subsection
+                    metrics.merge(snapshot)
+                if cache is not None:
+                    cache.set_parsed(url, subsection[1])
+            subsection = {
+                "title": subsection[0],
+                "content": subsection[1]
+            }
+            if writer is not None:
+                writer.write(url, subsection)
+            else:
+                # add to dictionary
+                subsections[url] = subsection
+
+    with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+        # pages are fetched concurrently but yielded back in registry order
+        for idx, (url, response, error) in enumerate(fetcher.fetch_all(urls, headers=headers)):
+            if idx % 100 == 0:
+                print(f"Processing url {idx}")
+
+            # report failed requests
+            if isinstance(error, HTTPError):
+                print(f"Error with url {url}")
+                print('The server couldn\'t fulfill the request.')
+                print('Error code: ', error.code)
+                n_failed += 1
+                metrics.increment("pages_failed")
+                continue
+            if isinstance(error, URLError):
+                print(f"Error with url {url}")
+                print('We failed to reach a server.')
+                print('Reason: ', error.reason)
+                n_failed += 1
+                metrics.increment("pages_failed")
+                continue
+
+            content = response.body
+            metrics.increment("bytes_fetched", len(content))
+            preproc_content = None
+            if cache is not None:
+                # 304 or identical body: reuse the cleaned text of the previous run
+                content, changed = cache.update(url, response)
+                if not changed:
+                    preproc_content = cache.get_parsed(url)
+            if preproc_content is None:
+                n_changed += 1
+                metrics.increment("pages_parsed")
+                if metrics.enabled():
+                    future = executor.submit(metrics.run_captured, parse_page, url, content)
+                else:
+                    future = executor.submit(parse_page, url, content)
+                pending.append((url, future, None))
+            else:
+                n_unchanged += 1
+                metrics.increment("pages_unchanged")
+                pending.append((url, None, (extract_info_from_url(url), preproc_content)))
+            collect(wait=False)
+        collect(wait=True)
+
+    if writer is not None:
+        writer.close()
+    else:
+        # save dictionary
+        with open(subsections_path, 'w') as f:
+            json.dump(subsections, f)
+    if cache is not None:
+        cache.save()
+    print(f"Changed pages: {n_changed}, unchanged pages: {n_unchanged}, failed pages: {n_failed}")
 
 
 if __name__ == "__main__":
@@ -55,5 +172,24 @@ if __name__ == "__main__":
     parser.add_argument('--limit', type=int, default=None)
     parser.add_argument('--urls_registry', type=str, default='./src/utils/urls.txt')
     parser.add_argument('--subsections_path', type=str, default='./documents/subsections.json')
+    parser.add_argument('--concurrency', type=int, default=8, help="Maximum number of requests in flight. 1 fetches sequentially.")
+    parser.add_argument('--rate_limit', type=float, default=10.0, help="Maximum requests per second per host. 0 disables the limit.")
+    parser.add_argument('--retries', type=int, default=3, help="Retries on connection errors, 429 and 5xx responses.")
+    parser.add_argument('--cache_dir', type=str, default='./cache/http', help="On-disk HTTP cache used for conditional re-fetching.")
+    parser.add_argument('--no_cache', action='store_true', help="Fetch and parse every page from scratch.")
+    parser.add_argument('--resume', action='store_true', help="Skip urls already present in the output file.")
+    parser.add_argument('--parse_workers', type=int, default=None, help="Number of parsing processes. Defaults to the number of CPUs.")
+    parser.add_argument('--versions', type=str, nargs='+', default=None, help="Engine versions to crawl, e.g. 5.1 5.2. Defaults to the versions of the registry urls.")
     args = parser.parse_args()
-    main(limit=args.limit, urls_registry=args.urls_registry, subsections_path=args.subsections_path)
+    main(
+        limit=args.limit,
+        urls_registry=args.urls_registry,
+        subsections_path=args.subsections_path,
+        concurrency=args.concurrency,
+        rate_limit=args.rate_limit,
+        retries=args.retries,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        parse_workers=args.parse_workers,
+        resume=args.resume,
+        versions=args.versions
+    )
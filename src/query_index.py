@@ -1,48 +1,84 @@
-import openai
-from InstructorEmbedding import INSTRUCTOR
+import asyncio
 import os
+import time
+import json
 import qdrant_client as qc
 import qdrant_client.http.models as models
+from qdrant_client.conversions.conversion import GrpcToRest, RestToGrpc
 from rich import print
 import webbrowser
-import torch
+from utils import metrics, qdrant_collections
+from utils.embedders import EMBEDDERS, get_embedder
+from utils.qdrant_config import load_config_cached, merge_config, search_params
+from utils.lexical import BM25Index, DEFAULT_LEXICAL_INDEX_PATH, is_lexical_query, reciprocal_rank_fusion
+from utils.numpy_search import NumpySearchIndex
+from utils.query_cache import default_query_cache
+from utils.query_client import QueryServerUnavailable, get_query_server_url, search_server
 
 CLIENT = qc.QdrantClient(url="localhost")
 METRIC = models.Distance.DOT
+# pages split by chunk.py have several points: on chunked collections, fetch more hits than needed before collapsing them
+CHUNK_OVERSAMPLING = 4
+# collection names are fetched at most once per ttl instead of once per query
+COLLECTION_CACHE = qdrant_collections.CollectionCache(ttl=30.0)
+# "qdrant", or "numpy" to search the embedding store in-process
+SEARCH_BACKENDS = ("qdrant", "numpy")
+RETRIEVAL_MODES = ("auto", "dense", "lexical", "hybrid")
 
-def embed_query(query, embedder):
+_query_cache = None
+_async_client = None
+_numpy_indexes = {}
+_lexical_indexes = {}
 
-    if embedder == "openai":
-        # Fetch API key from environment variable or prompt user for it
-        api_key = os.getenv('API_KEY')
-        if api_key is None:
-            api_key = input("Please enter your OpenAI API key: ")
-        
-        openai_model = "text-embedding-ada-002"
 
-        openai.api_key = api_key
-        response = openai.Embedding.create(
-                    input=query,
-                    model=openai_model
-        )
-        embedding = response['data'][0]['embedding']
-
-    elif embedder == "instructor":
-        instructor_model = INSTRUCTOR('hkunlp/instructor-xl')
-         # set device to gpu if available
-        if (torch.backends.mps.is_available()) and (torch.backends.mps.is_built()):
-            device = torch.device("mps")
-        elif torch.cuda.is_available():
-            device = torch.device("cuda")
-        else:
-            device = torch.device("cpu")
-
-        instruction = "Represent the UnrealEngine query for retrieving supporting documents:"
-        embedding = instructor_model.encode([[instruction, query]], device=device)
-        embedding = [float(x) for x in embedding.squeeze().tolist()]
-    else:
-        raise ValueError("Embedder must be 'openai' or 'instructor'")
-    return embedding
+class CollectionNotFound(Exception):
+    """Raised when the searched Qdrant collection does not exist."""
+
+
+def get_query_cache():
+    """Query embedding cache of the process, created on first use."""
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = default_query_cache()
+    return _query_cache
+
+
+@metrics.timed("query_index.embed_queries")
+def embed_queries(queries, embedder):
+    """Embed several queries at once.
+
+    Cached queries are reused, the others are embedded in a single model call
+    (or OpenAI request).
+
+    Args:
+        queries (list of str): Queries to embed.
+        embedder (str): Name of the embedder, e.g. "openai" or "instructor".
+
+    Returns:
+        list of list of float: One embedding per query, in order.
+    """
+    backend = get_embedder(embedder)
+
+    # repeated queries skip the model (or the paid OpenAI call)
+    cache = get_query_cache()
+    embeddings = [cache.get(embedder, backend.model, backend.query_instruction, query) for query in queries]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    metrics.increment("query_cache_hits", len(queries) - len(missing))
+    metrics.increment("query_cache_misses", len(missing))
+    if not missing:
+        return embeddings
+
+    with metrics.span("query_index.encode"):
+        new_embeddings = backend.embed_queries([queries[i] for i in missing])
+    for i, embedding in zip(missing, new_embeddings):
+        embeddings[i] = embedding
+        cache.set(embedder, backend.model, backend.query_instruction, queries[i], embedding)
+    return embeddings
+
+
+@metrics.timed("query_index.embed_query")
+def embed_query(query, embedder):
+    return embed_queries([query], embedder)[0]
 
 
 def parse_block_types(block_types):
@@ -53,6 +89,33 @@ def parse_block_types(block_types):
     return block_types
 
 
+def parse_versions(versions):
+    """Normalize the version filter: None (all versions), '5.1', '5.1,5.2' or a list."""
+    if versions is None:
+        return None
+    if type(versions) == str:
+        versions = versions.split(',')
+    return [version.strip() for version in versions if version.strip()]
+
+
+def parse_doc_areas(doc_areas):
+    """Normalize the doc area filter: None (all areas), 'animation', 'animation,materials' or a list."""
+    return parse_versions(doc_areas)
+
+
+def field_filter(key, values):
+    """Filter matching points whose `key` payload field holds one of `values` (backed by a payload index)."""
+    return models.Filter(
+        should=[
+            models.FieldCondition(
+                key=key,
+                match=models.MatchValue(value=value),
+            )
+            for value in values
+        ]
+    )
+
+
 def get_collection_name():
     collection_name = os.getenv("UE5_DOCS_COLLECTION_NAME")
     if collection_name is None or collection_name == "None":
@@ -60,74 +123,316 @@ def get_collection_name():
     return collection_name
 
 
+def get_search_backend():
+    backend = os.getenv("UE5_DOCS_SEARCH_BACKEND")
+    if backend is None or backend == "None":
+        backend = "qdrant"
+    if backend not in SEARCH_BACKENDS:
+        raise ValueError(f"Search backend must be one of {SEARCH_BACKENDS}. Not {backend}")
+    return backend
+
+
+def get_numpy_index(embedder):
+    """In-process search index of an embedder, loaded on first use.
+
+    Reads the embedding store at $UE5_DOCS_EMBEDDINGS_PATH (default ./embeddings/<embedder>_embeddings)
+    and the subsections at $UE5_DOCS_CONTENT_PATH (default ./documents/subsections.json).
+    """
+    embeddings_path = os.getenv("UE5_DOCS_EMBEDDINGS_PATH", f"./embeddings/{embedder}_embeddings")
+    content_path = os.getenv("UE5_DOCS_CONTENT_PATH", "./documents/subsections.json")
+    key = (embeddings_path, content_path)
+    if key not in _numpy_indexes:
+        _numpy_indexes[key] = NumpySearchIndex(embeddings_path, content_path)
+    return _numpy_indexes[key]
+
+
+def get_retrieval_mode():
+    mode = os.getenv("UE5_DOCS_RETRIEVAL_MODE")
+    if mode is None or mode == "None":
+        mode = "auto"
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Retrieval mode must be one of {RETRIEVAL_MODES}. Not {mode}")
+    return mode
+
+
+def get_lexical_index(required=False):
+    """BM25 index at $UE5_DOCS_LEXICAL_INDEX (default ./indexes/lexical_index.json), loaded on first use.
+
+    Returns None if it was not built, unless `required` is set.
+    """
+    path = os.getenv("UE5_DOCS_LEXICAL_INDEX", DEFAULT_LEXICAL_INDEX_PATH)
+    if path not in _lexical_indexes:
+        if not os.path.exists(path):
+            if required:
+                raise FileNotFoundError(f"No lexical index at {path}. Build it with create_index.py or src/utils/lexical.py")
+            return None
+        _lexical_indexes[path] = BM25Index.load(path)
+    return _lexical_indexes[path]
+
+
 def collection_exists(collection_name):
-    collections = CLIENT.get_collections().collections
-    collection_names = [collection.name for collection in collections]
-    return collection_name in collection_names
+    # the collection name is usually an alias of the live collection version
+    return COLLECTION_CACHE.exists(CLIENT, collection_name)
 
 
 def list_collections():
-    collections = CLIENT.get_collections().collections
-    collection_names = [collection.name for collection in collections]
-    print(collection_names)
+    """Return the names of the collections and aliases of the Qdrant instance."""
+    return COLLECTION_CACHE.get_names(CLIENT)
+
 
+def collapse_chunks(results, top_k):
+    """Keep the best scored hit of every page.
+
+    Args:
+        results (list of ScoredPoint): Search hits, sorted by decreasing score.
+        top_k (int): Maximum number of pages to return.
 
-def query_index(query, embedder, top_k=10, block_types=None):
+    Returns:
+        list of ScoredPoint: At most one hit per page url, sorted by decreasing score.
+    """
+    collapsed = []
+    seen_urls = set()
+    for res in results:
+        if res.payload['url'] in seen_urls:
+            continue
+        seen_urls.add(res.payload['url'])
+        collapsed.append(res)
+        if len(collapsed) == top_k:
+            break
+    return collapsed
+
+
+@metrics.timed("query_index.query_index")
+def query_index(query, embedder, top_k=10, block_types=None, search_config=None, versions=None, backend=None, mode=None, doc_areas=None):
     """
     Queries the Qdrant vector index DB for documents that match the given query.
 
     Args:
         query (str): The query to search for.
-        embedder (str): The embedder to use. Must be either "openai" or "instructor".
+        embedder (str): The embedder to use, e.g. "openai" or "instructor" (see utils/embedders.py).
         top_k (int, optional): The maximum number of documents to return. Defaults to 10.
         block_types (str or list of str, optional): The types of document blocks to search in. Defaults to "text".
+        search_config (dict, optional): Overrides of the "search" section of the Qdrant config (hnsw_ef, exact,
+            rescore, oversampling, ignore_quantization).
+        versions (str or list of str, optional): Engine versions to search in, e.g. "5.1". Defaults to all versions.
+        backend (str, optional): "qdrant", or "numpy" for an exact search of the embedding store in this process.
+            Defaults to $UE5_DOCS_SEARCH_BACKEND, else "qdrant".
+        mode (str, optional): "dense", "lexical" (BM25 index only), "hybrid" (fusion of both rankings) or "auto"
+            (lexical for identifier-like queries such as 'r.Nanite', dense otherwise). Defaults to
+            $UE5_DOCS_RETRIEVAL_MODE, else "auto".
+        doc_areas (str or list of str, optional): Documentation areas to search in, e.g. "animation" or
+            "blueprintapi" (see extract_doc_area_from_url). Defaults to all areas.
 
     Returns:
-        A list of dictionaries representing the matching documents, sorted by relevance. Each dictionary contains the following keys:
+        A list of dictionaries representing the matching documents, sorted by relevance. Chunks of the same page are collapsed into
+        their best scored one. Each dictionary contains the following keys:
         - "id": The ID of the document.
         - "score": The relevance score of the document.
         - "text": The text content of the document.
         - "block_type": The type of the document block that matched the query.
     """
+    mode = mode or get_retrieval_mode()
+    lexical_results = None
+    if mode in ("lexical", "hybrid") or (mode == "auto" and is_lexical_query(query)):
+        lexical_index = get_lexical_index(required=mode == "lexical")
+        if lexical_index is not None:
+            _, _, limit = build_search(top_k, block_types, search_config, versions, lexical_index.chunked, doc_areas)
+            with metrics.span("query_index.lexical_search"):
+                lexical_results = lexical_index.search(
+                    query, limit, parse_block_types(block_types), parse_versions(versions), parse_doc_areas(doc_areas)
+                )
+    # identifier-like queries are answered without loading the embedding model
+    if mode == "lexical" or (mode == "auto" and lexical_results):
+        return format_results(lexical_results, top_k)
+
+    results = dense_search(query, embedder, top_k, block_types, search_config, versions, backend, doc_areas)
+    if mode == "hybrid" and lexical_results is not None:
+        results = reciprocal_rank_fusion([results, lexical_results], max(limit, len(results)))
+    return format_results(results, top_k)
+
+
+def dense_search(query, embedder, top_k, block_types, search_config, versions, backend, doc_areas=None):
+    """Embedding search of query_index, returning the uncollapsed hits."""
+    if (backend or get_search_backend()) == "numpy":
+        vector = embed_query(query, embedder)
+        index = get_numpy_index(embedder)
+        _, _, limit = build_search(top_k, block_types, search_config, versions, index.chunked, doc_areas)
+        with metrics.span("query_index.search"):
+            return index.search(vector, limit, parse_block_types(block_types), parse_versions(versions), parse_doc_areas(doc_areas))
+
     collection_name = get_collection_name()
 
     if not collection_exists(collection_name):
-        raise Exception(f"Collection {collection_name} does not exist. Exisiting collections are: {list_collections()}")
-        
-
+        raise CollectionNotFound(f"Collection {collection_name} does not exist. Exisiting collections are: {list_collections()}")
 
     vector = embed_query(query, embedder)
-
-    _search_params = models.SearchParams(
-        hnsw_ef=128,
-        exact=False
+    _filter, _search_params, limit = build_search(
+        top_k, block_types, search_config, versions, COLLECTION_CACHE.is_chunked(CLIENT, collection_name), doc_areas
     )
 
-    block_types = parse_block_types(block_types)
+    with metrics.span("query_index.search"):
+        return CLIENT.search(
+            collection_name=collection_name,
+            query_vector=vector,
+            query_filter=_filter,
+            limit=limit,
+            with_payload=True,
+            search_params=_search_params,
+        )
+
 
-    _filter = models.Filter(
-        must=[
-            models.Filter(
-                should= [
-                    models.FieldCondition(
-                        key="block_type",
-                        match=models.MatchValue(value=bt),
-                    )
-                for bt in block_types
-                ]  
+def query_index_batch(queries, embedder, top_k=10, block_types=None, search_config=None, versions=None, batch_size=64, backend=None, doc_areas=None):
+    """
+    Queries the Qdrant vector index DB for many queries, e.g. for offline evaluation jobs.
+
+    Queries are embedded by batches of `batch_size` and every batch is sent as a single
+    Qdrant batch search request.
+
+    Args:
+        queries (iterable of str): The queries to search for. Consumed lazily.
+        embedder (str): The embedder to use, e.g. "openai" or "instructor" (see utils/embedders.py).
+        top_k (int, optional): The maximum number of documents to return per query. Defaults to 10.
+        block_types (str or list of str, optional): The types of document blocks to search in. Defaults to "text".
+        search_config (dict, optional): Overrides of the "search" section of the Qdrant config.
+        versions (str or list of str, optional): Engine versions to search in. Defaults to all versions.
+        batch_size (int, optional): Number of queries embedded and searched together. Defaults to 64.
+        backend (str, optional): "qdrant" or "numpy", as in query_index.
+        doc_areas (str or list of str, optional): Documentation areas to search in. Defaults to all areas.
+
+    Yields:
+        tuple: (query, results) in input order, results being as returned by query_index.
+    """
+    backend = backend or get_search_backend()
+    collection_name = get_collection_name()
+
+    if backend == "qdrant" and not collection_exists(collection_name):
+        raise CollectionNotFound(f"Collection {collection_name} does not exist. Exisiting collections are: {list_collections()}")
+
+    if backend == "numpy":
+        chunked = get_numpy_index(embedder).chunked
+    else:
+        chunked = COLLECTION_CACHE.is_chunked(CLIENT, collection_name)
+    _filter, _search_params, limit = build_search(top_k, block_types, search_config, versions, chunked, doc_areas)
+
+    def search(batch):
+        vectors = embed_queries(batch, embedder)
+        if backend == "numpy":
+            batch_results = get_numpy_index(embedder).search_batch(
+                vectors, limit, parse_block_types(block_types), parse_versions(versions), parse_doc_areas(doc_areas)
+            )
+            return [(query, format_results(results, top_k)) for query, results in zip(batch, batch_results)]
+        requests = [
+            models.SearchRequest(
+                vector=vector,
+                filter=_filter,
+                params=_search_params,
+                limit=limit,
+                with_payload=True,
             )
+            for vector in vectors
         ]
+        batch_results = CLIENT.search_batch(collection_name=collection_name, requests=requests)
+        return [(query, format_results(results, top_k)) for query, results in zip(batch, batch_results)]
+
+    batch = []
+    for query in queries:
+        batch.append(query)
+        if len(batch) == batch_size:
+            yield from search(batch)
+            batch = []
+    if batch:
+        yield from search(batch)
+
+
+def get_async_client():
+    """Qdrant client of the async query path, created on first use.
+
+    Its gRPC channel is bound to the event loop it is first used in, so the async
+    path is meant to run in one long-lived loop, e.g. a web worker.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = qc.QdrantClient(url="localhost", prefer_grpc=True)
+    return _async_client
+
+
+async def query_index_async(query, embedder, top_k=10, block_types=None, search_config=None, versions=None, doc_areas=None):
+    """
+    Async variant of query_index, searching over the async gRPC channel of a shared Qdrant client.
+
+    Concurrent calls share one connection and do not block the event loop: the query is
+    embedded in the default executor and the collection check is cached (see COLLECTION_CACHE).
+
+    Args:
+        query (str): The query to search for.
+        embedder (str): The embedder to use, e.g. "openai" or "instructor" (see utils/embedders.py).
+        top_k (int, optional): The maximum number of documents to return. Defaults to 10.
+        block_types (str or list of str, optional): The types of document blocks to search in. Defaults to "text".
+        search_config (dict, optional): Overrides of the "search" section of the Qdrant config.
+        versions (str or list of str, optional): Engine versions to search in. Defaults to all versions.
+        doc_areas (str or list of str, optional): Documentation areas to search in. Defaults to all areas.
+
+    Returns:
+        list of tuple: (url, text, score), as returned by query_index.
+    """
+    client = get_async_client()
+    collection_name = get_collection_name()
+
+    if not await COLLECTION_CACHE.exists_async(client, collection_name):
+        raise CollectionNotFound(f"Collection {collection_name} does not exist. Exisiting collections are: {COLLECTION_CACHE.names}")
+
+    vector = await asyncio.get_running_loop().run_in_executor(None, embed_query, query, embedder)
+    _filter, _search_params, limit = build_search(
+        top_k, block_types, search_config, versions, await COLLECTION_CACHE.is_chunked_async(client, collection_name), doc_areas
     )
 
-    results = CLIENT.search(
-        collection_name=collection_name,
-        query_vector=vector,
-        query_filter=_filter,
-        limit=top_k,
-        with_payload=True,
-        search_params=_search_params,
-    
+    request = RestToGrpc.convert_search_request(
+        models.SearchRequest(
+            vector=vector,
+            filter=_filter,
+            params=_search_params,
+            limit=limit,
+            with_payload=True,
+        ),
+        collection_name
     )
+    response = await client.async_grpc_points.Search(request)
+    results = [GrpcToRest.convert_scored_point(point) for point in response.result]
+    return format_results(results, top_k)
+
+
+def build_search(top_k, block_types, search_config, versions, chunked=False, doc_areas=None):
+    """Build the filter, search parameters and number of hits to fetch of a search.
+
+    Args:
+        chunked (bool): Whether the searched points are page chunks, collapsed to one hit per page afterwards.
+        doc_areas (str or list of str, optional): Documentation areas to search in.
+
+    Returns:
+        tuple: (Filter, SearchParams, limit).
+    """
+    # the config file is only read again when it changes, e.g. after tune_search.py
+    config = merge_config(load_config_cached(), {"search": search_config})
+    _search_params = search_params(config)
+    # quantized collections: fetch more candidates, rescored with the original vectors, then truncate
+    limit = int(top_k * (CHUNK_OVERSAMPLING if chunked else 1) * max(config["search"]["oversampling"], 1.0))
+
+    block_types = parse_block_types(block_types)
+
+    conditions = [field_filter("block_type", block_types)]
+    versions = parse_versions(versions)
+    if versions:
+        conditions.append(field_filter("version", versions))
+    doc_areas = parse_doc_areas(doc_areas)
+    if doc_areas:
+        conditions.append(field_filter("doc_area", doc_areas))
+    _filter = models.Filter(must=conditions)
+    return _filter, _search_params, limit
+
+
+def format_results(results, top_k):
+    """Collapse the hits of a search to `top_k` pages, as (url#anchor, text, score) tuples."""
+    results = collapse_chunks(results, top_k)
 
     results = [
         (
@@ -168,31 +473,57 @@ def ue5_docs_search(
     top_k=10, 
     block_types=None,
     score=False,
-    open_url=True
+    open_url=True,
+    search_config=None,
+    versions=None,
+    backend=None,
+    mode=None,
+    doc_areas=None
 ):
     """
     Searches the Qdrant vector index DB for documents related to the given query and prints the top results.
 
+    The search runs on the query server (see query_server.py) if one is running, which keeps the embedding
+    model loaded between queries, and in this process otherwise.
+
     Args:
         query (str): The query to search for.
-        embedder (str): The embedder to use. Must be either "openai" or "instructor".
+        embedder (str): The embedder to use, e.g. "openai" or "instructor" (see utils/embedders.py).
         top_k (int, optional): The maximum number of documents to return. Defaults to 10.
         block_types (str or list of str, optional): The types of document blocks to search in. Defaults to "text".
         score (bool, optional): Whether to include the relevance score in the output. Defaults to False.
         open_url (bool, optional): Whether to open the top URL in a web browser. Defaults to True.
+        search_config (dict, optional): Overrides of the "search" section of the Qdrant config.
+        versions (str or list of str, optional): Engine versions to search in. Defaults to all versions.
+        backend (str, optional): "qdrant" or "numpy", as in query_index.
+        mode (str, optional): "auto", "dense", "lexical" or "hybrid", as in query_index.
+        doc_areas (str or list of str, optional): Documentation areas to search in. Defaults to all areas.
 
     Returns:
         None
     """
-    # Check if embedder is 'openai' or 'instructor'. raise error if not
-    assert embedder in ['openai', 'instructor'], f"Embedder must be 'openai' or 'instructor'. Not {embedder}"
+    # Check if the embedder is registered. raise error if not
+    assert embedder in EMBEDDERS, f"Embedder must be one of {sorted(EMBEDDERS)}. Not {embedder}"
 
-    results = query_index(
-        query,
+    options = dict(
         embedder=embedder,
         top_k=top_k,
-        block_types=block_types
+        block_types=block_types,
+        search_config=search_config,
+        versions=versions,
+        backend=backend,
+        mode=mode,
+        doc_areas=doc_areas
     )
+    results = None
+    server_url = get_query_server_url()
+    if server_url is not None:
+        try:
+            results = search_server(server_url, query, **options)
+        except QueryServerUnavailable:
+            pass
+    if results is None:
+        results = query_index(query, **options)
 
     print_results(query, results, score=score)
     if open_url:
@@ -209,13 +540,23 @@ class Ue5DocSearch():
             top_k = None, 
             block_types = None, 
             score = False, 
-            open_url = True
+            open_url = True,
+            search_config = None,
+            versions = None,
+            backend = None,
+            mode = None,
+            doc_areas = None
             ):
         self.default_embedder = embedder
         self.default_top_k = top_k
         self.default_block_types = block_types
         self.default_score = score
         self.default_open_url = open_url
+        self.default_search_config = search_config
+        self.default_versions = versions
+        self.default_backend = backend
+        self.default_mode = mode
+        self.default_doc_areas = doc_areas
         
     def __call__(
             self, 
@@ -224,7 +565,12 @@ class Ue5DocSearch():
             top_k = None, 
             block_types = None, 
             score = None, 
-            open_url = None
+            open_url = None,
+            search_config = None,
+            versions = None,
+            backend = None,
+            mode = None,
+            doc_areas = None
             ):
         args_dict = {}
 
@@ -253,9 +599,73 @@ class Ue5DocSearch():
         if open_url is not None:
             args_dict["open_url"] = open_url
 
+        if search_config is None:
+            search_config = self.default_search_config
+        if search_config is not None:
+            args_dict["search_config"] = search_config
+
+        if versions is None:
+            versions = self.default_versions
+        if versions is not None:
+            args_dict["versions"] = versions
+
+        if backend is None:
+            backend = self.default_backend
+        if backend is not None:
+            args_dict["backend"] = backend
+
+        if mode is None:
+            mode = self.default_mode
+        if mode is not None:
+            args_dict["mode"] = mode
+
+        if doc_areas is None:
+            doc_areas = self.default_doc_areas
+        if doc_areas is not None:
+            args_dict["doc_areas"] = doc_areas
+
         ue5_docs_search(query, **args_dict)
 
 
+class AsyncUe5DocSearch():
+    """Async counterpart of Ue5DocSearch for servers: returns the results instead of printing them."""
+    def __init__(
+            self,
+            embedder = "openai",
+            top_k = 10,
+            block_types = None,
+            search_config = None,
+            versions = None,
+            doc_areas = None
+            ):
+        self.default_embedder = embedder
+        self.default_top_k = top_k
+        self.default_block_types = block_types
+        self.default_search_config = search_config
+        self.default_versions = versions
+        self.default_doc_areas = doc_areas
+
+    async def __call__(
+            self,
+            query,
+            embedder = None,
+            top_k = None,
+            block_types = None,
+            search_config = None,
+            versions = None,
+            doc_areas = None
+            ):
+        return await query_index_async(
+            query,
+            embedder=embedder or self.default_embedder,
+            top_k=top_k or self.default_top_k,
+            block_types=block_types or self.default_block_types,
+            search_config=search_config or self.default_search_config,
+            versions=versions or self.default_versions,
+            doc_areas=doc_areas or self.default_doc_areas
+        )
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
@@ -265,10 +675,48 @@ if __name__ == "__main__":
     parser.add_argument('--score', type=bool, default=False)
     parser.add_argument('--open_url', type=bool, default=True)
     parser.add_argument('--embedder', type=str, default='instructor')
+    parser.add_argument('--version', type=str, default=None, help="Engine versions to search in, comma separated, e.g. 5.1. Defaults to all.")
+    parser.add_argument('--doc_area', type=str, default=None, help="Documentation areas to search in, comma separated, e.g. animation,materials. Defaults to all.")
+    parser.add_argument('--hnsw_ef', type=int, default=None, help="Candidates explored by the HNSW search.")
+    parser.add_argument('--exact', action='store_true', default=None, help="Exhaustive search, bypassing the HNSW index.")
+    parser.add_argument('--no_rescore', action='store_true', help="Do not re-rank quantized hits with the original vectors.")
+    parser.add_argument('--oversampling', type=float, default=None, help="Fetch this many times more quantized hits before rescoring.")
+    parser.add_argument('--backend', type=str, default=None, choices=SEARCH_BACKENDS, help="Search backend. Defaults to $UE5_DOCS_SEARCH_BACKEND, else qdrant.")
+    parser.add_argument('--mode', type=str, default=None, choices=RETRIEVAL_MODES, help="Dense, lexical (BM25), hybrid, or auto (lexical for identifier-like queries). Default is auto.")
+    parser.add_argument('--embeddings_path', type=str, default=None, help="Embedding store searched by the numpy backend.")
+    parser.add_argument('--content_path', type=str, default=None, help="Subsections searched by the numpy backend.")
+    parser.add_argument('--queries_file', type=str, default=None, help="Run every query of this file, one per line, through the batch API.")
+    parser.add_argument('--output', type=str, default=None, help="JSON lines output of --queries_file. Defaults to printing the results.")
+    parser.add_argument('--batch_size', type=int, default=64, help="Queries embedded and searched together with --queries_file.")
     args = parser.parse_args()
-    if args.embedder == 'openai':
-        DIMENSION = 1536
+    search_config = {
+        "hnsw_ef": args.hnsw_ef,
+        "exact": args.exact,
+        "rescore": False if args.no_rescore else None,
+        "oversampling": args.oversampling,
+    }
+    if args.embeddings_path is not None:
+        os.environ["UE5_DOCS_EMBEDDINGS_PATH"] = args.embeddings_path
+    if args.content_path is not None:
+        os.environ["UE5_DOCS_CONTENT_PATH"] = args.content_path
+    if args.queries_file is not None:
+        with open(args.queries_file, 'r') as f:
+            queries = [line.strip() for line in f if line.strip()]
+        output = open(args.output, 'w') if args.output is not None else None
+        start_time = time.perf_counter()
+        for query, results in query_index_batch(
+            queries, args.embedder, top_k=args.top_k, block_types=args.block_types,
+            search_config=search_config, versions=args.version, batch_size=args.batch_size, backend=args.backend,
+            doc_areas=args.doc_area
+        ):
+            if output is not None:
+                output.write(json.dumps({"query": query, "results": results}) + "\n")
+            else:
+                print_results(query, results, score=args.score)
+        elapsed = time.perf_counter() - start_time
+        if output is not None:
+            output.close()
+        print(f"Ran {len(queries)} queries in {elapsed:.1f}s ({len(queries) / elapsed:.1f} queries/sec)")
     else:
-        DIMENSION = 768
-    fosearch = Ue5DocSearch(embedder=args.embedder, open_url=args.open_url, top_k=args.top_k, score=args.score, block_types=args.block_types)
-    fosearch(args.query)
\ No newline at end of file
+        fosearch = Ue5DocSearch(embedder=args.embedder, open_url=args.open_url, top_k=args.top_k, score=args.score, block_types=args.block_types, search_config=search_config, versions=args.version, backend=args.backend, mode=args.mode, doc_areas=args.doc_area)
+        fosearch(args.query)
\ No newline at end of file
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import query_index
+from utils.embedders import CPU_THREADS_ENV, EMBEDDERS, get_embedder
+from utils.query_client import DEFAULT_QUERY_SERVER_URL
+
+SEARCH_OPTIONS = ("embedder", "top_k", "block_types", "search_config", "versions", "backend", "mode", "doc_areas")
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Serves GET /health and POST /search on top of query_index, in a process that keeps its models loaded."""
+    # keep connections alive between requests of the same client
+    protocol_version = "HTTP/1.1"
+    default_embedder = "instructor"
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip('/') != "/health":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            backend = query_index.get_search_backend()
+            health = {
+                "status": "ok",
+                "backend": backend,
+                "loaded_embedders": [name for name in EMBEDDERS if get_embedder(name).loaded],
+                "query_cache": query_index.get_query_cache().stats(),
+            }
+            # the numpy backend serves without any Qdrant server
+            if backend == "qdrant":
+                health["collection"] = query_index.get_collection_name()
+                health["collection_exists"] = query_index.collection_exists(health["collection"])
+        except Exception as e:
+            self._send_json(200, {"status": "error", "error": str(e)})
+            return
+        self._send_json(200, health)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != "/search":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            query = request["query"]
+        except (ValueError, KeyError):
+            self._send_json(400, {"error": "Expected a json body with a 'query'"})
+            return
+        options = {key: request[key] for key in SEARCH_OPTIONS if request.get(key) is not None}
+        options.setdefault("embedder", self.default_embedder)
+        start_time = time.perf_counter()
+        try:
+            results = query_index.query_index(query, **options)
+        # errors of the request itself fail the same way on every retry and in-process
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except (query_index.CollectionNotFound, FileNotFoundError) as e:
+            self._send_json(404, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {
+            "results": [[url, text, float(score)] for url, text, score in results],
+            "elapsed_ms": (time.perf_counter() - start_time) * 1000,
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QueryServer(ThreadingHTTPServer):
+    # the default listen backlog of 5 refuses bursts of concurrent clients
+    request_queue_size = 128
+    daemon_threads = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-running query server keeping the embedding model warm.")
+    parser.add_argument('--host', type=str, default="localhost")
+    parser.add_argument('--port', type=int, default=int(DEFAULT_QUERY_SERVER_URL.rsplit(':', 1)[1]))
+    parser.add_argument('--embedder', type=str, default='instructor', help="Embedder of requests that do not name one, loaded at startup.")
+    parser.add_argument('--backend', type=str, default=None, choices=query_index.SEARCH_BACKENDS, help="Default search backend, loaded at startup.")
+    parser.add_argument('--cpu_threads', type=int, default=None, help="Torch threads of the instructor-int8 embedder.")
+    args = parser.parse_args()
+    if args.cpu_threads is not None:
+        os.environ[CPU_THREADS_ENV] = str(args.cpu_threads)
+    QueryHandler.default_embedder = args.embedder
+    if args.backend is not None:
+        os.environ["UE5_DOCS_SEARCH_BACKEND"] = args.backend
+
+    # pay the model loading once, before accepting queries
+    start_time = time.perf_counter()
+    get_embedder(args.embedder).load()
+    if query_index.get_search_backend() == "numpy":
+        print(f"Loaded {len(query_index.get_numpy_index(args.embedder))} vectors for the numpy backend")
+    print(f"Embedder {args.embedder} ready in {time.perf_counter() - start_time:.1f}s")
+
+    server = QueryServer((args.host, args.port), QueryHandler)
+    print(f"Query server on http://{args.host}:{args.port} (GET /health, POST /search)")
+    server.serve_forever()
@@ -0,0 +1,167 @@
+import argparse
+import itertools
+import json
+import os
+import time
+import numpy as np
+import query_index
+from utils.qdrant_config import CONFIG_PATH_ENV, DEFAULT_CONFIG, DEFAULT_CONFIG_PATH, load_config, merge_config, save_config
+
+
+def load_queries(path):
+    """Load an eval set or a query log.
+
+    Args:
+        path (str): Text file with one query per line, or json lines with a "query" field
+                    (e.g. the output of `query_index.py --queries_file`).
+
+    Returns:
+        list of str: The queries, without duplicates.
+    """
+    queries = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            queries.append(json.loads(line)["query"] if path.endswith(".jsonl") else line)
+    return list(dict.fromkeys(queries))
+
+
+def search_ids(collection_name, vectors, search_config, top_k, block_types, versions, limit=None, chunked=False):
+    """Run one search per vector and time each of them.
+
+    Args:
+        limit (int, optional): Number of hits kept. Defaults to the limit of the search config.
+        chunked (bool): Whether the collection holds page chunks, as in query_index.build_search.
+
+    Returns:
+        tuple: (list of list of point ids, list of seconds per search).
+    """
+    _filter, _search_params, search_limit = query_index.build_search(top_k, block_types, search_config, versions, chunked)
+    ids = []
+    timings = []
+    for vector in vectors:
+        start = time.perf_counter()
+        hits = query_index.CLIENT.search(
+            collection_name=collection_name,
+            query_vector=vector,
+            query_filter=_filter,
+            limit=search_limit,
+            with_payload=False,
+            search_params=_search_params,
+        )
+        timings.append(time.perf_counter() - start)
+        ids.append([hit.id for hit in hits][:limit or search_limit])
+    return ids, timings
+
+
+def candidate_configs(hnsw_ef_values, oversampling_values, quantized):
+    """Search configs of the sweep. Rescoring and oversampling are only swept on quantized collections.
+
+    Every candidate sets all the parameters it depends on, so neither the search nor the
+    written config inherits e.g. an oversampling left in the config by an earlier tuning.
+    """
+    if not quantized:
+        return [{"hnsw_ef": hnsw_ef, "exact": False, "oversampling": 1.0} for hnsw_ef in hnsw_ef_values]
+    return [
+        {"hnsw_ef": hnsw_ef, "exact": False, "rescore": rescore, "oversampling": oversampling, "ignore_quantization": False}
+        for hnsw_ef, rescore, oversampling in itertools.product(hnsw_ef_values, (True, False), oversampling_values)
+        # without rescoring, extra quantized hits are truncated in the same order
+        if rescore or oversampling == 1.0
+    ]
+
+
+def tune_search(queries, embedder, top_k=10, hnsw_ef_values=(16, 32, 64, 128, 256, 512),
+                oversampling_values=(1.0, 1.5, 2.0, 3.0), target_recall=0.98, rounds=3, block_types=None, versions=None):
+    """Measure recall and latency of search configs against an exact search, and pick the fastest good enough one.
+
+    Args:
+        queries (list of str): Eval set or query log.
+        embedder (str): Embedder of the collection.
+        top_k (int): Number of results of query_index. Recall is measured on the hits it fetches.
+        hnsw_ef_values (list of int): hnsw_ef values to try.
+        oversampling_values (list of float): Oversampling values to try on quantized collections.
+        target_recall (float): Minimum mean recall of the chosen config.
+        rounds (int): Number of timed passes over the queries per config.
+        block_types (str or list of str, optional): Block types filter of the searches.
+        versions (str or list of str, optional): Engine versions filter of the searches.
+
+    Returns:
+        tuple: (chosen search config, list of measurements of every config).
+    """
+    collection_name = query_index.get_collection_name()
+    if not query_index.collection_exists(collection_name):
+        raise Exception(f"Collection {collection_name} does not exist. Exisiting collections are: {query_index.list_collections()}")
+    quantized = query_index.CLIENT.get_collection(collection_name).config.quantization_config is not None
+    chunked = query_index.COLLECTION_CACHE.is_chunked(query_index.CLIENT, collection_name)
+    vectors = query_index.embed_queries(queries, embedder)
+
+    # hits fetched by query_index before collapsing chunks, without oversampling
+    _, _, limit = query_index.build_search(top_k, block_types, {"oversampling": 1.0}, versions, chunked)
+    exact_config = {"exact": True, "ignore_quantization": True, "oversampling": 1.0}
+    expected, exact_timings = search_ids(collection_name, vectors, exact_config, top_k, block_types, versions, limit, chunked)
+    print(f"{len(queries)} queries on {collection_name}{' (quantized)' if quantized else ''}, recall@{limit}, "
+          f"exact search p50 {np.percentile(exact_timings, 50) * 1000:.2f} ms")
+
+    measurements = []
+    for search_config in candidate_configs(hnsw_ef_values, oversampling_values, quantized):
+        timings = []
+        for _ in range(rounds):
+            found, round_timings = search_ids(collection_name, vectors, search_config, top_k, block_types, versions, limit, chunked)
+            timings.extend(round_timings)
+        recall = np.mean([
+            len(set(hits) & set(exact_hits)) / len(exact_hits) if exact_hits else 1.0
+            for hits, exact_hits in zip(found, expected)
+        ])
+        timings_ms = np.asarray(timings) * 1000
+        measurement = {
+            "search": search_config,
+            "recall": float(recall),
+            "p50_ms": float(np.percentile(timings_ms, 50)),
+            "p95_ms": float(np.percentile(timings_ms, 95)),
+        }
+        measurements.append(measurement)
+        print(f"{json.dumps(search_config): <100} recall {recall:.3f}  "
+              f"p50 {measurement['p50_ms']:7.2f} ms  p95 {measurement['p95_ms']:7.2f} ms")
+
+    good_enough = [measurement for measurement in measurements if measurement["recall"] >= target_recall]
+    if good_enough:
+        chosen = min(good_enough, key=lambda measurement: (measurement["p95_ms"], -measurement["recall"]))
+    else:
+        print(f"No config reaches a recall of {target_recall}, choosing the most accurate one.")
+        chosen = max(measurements, key=lambda measurement: (measurement["recall"], -measurement["p95_ms"]))
+    return chosen["search"], measurements
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the search parameters of the collection for recall and latency.")
+    parser.add_argument('--queries_file', type=str, default='./benchmarks/fixtures/queries.txt', help="Queries, one per line, or json lines with a 'query' field.")
+    parser.add_argument('--embedder', type=str, default='instructor')
+    parser.add_argument('--top_k', type=int, default=10)
+    parser.add_argument('--block_types', type=str, default=None)
+    parser.add_argument('--version', type=str, default=None, help="Engine versions to search, comma separated.")
+    parser.add_argument('--hnsw_ef_values', type=int, nargs='+', default=[16, 32, 64, 128, 256, 512])
+    parser.add_argument('--oversampling_values', type=float, nargs='+', default=[1.0, 1.5, 2.0, 3.0], help="Only swept on quantized collections.")
+    parser.add_argument('--target_recall', type=float, default=0.98)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--config', type=str, default=None, help=f"Config updated with the chosen parameters. Defaults to ${CONFIG_PATH_ENV}, else {DEFAULT_CONFIG_PATH}.")
+    parser.add_argument('--report', type=str, default=None, help="Json file receiving the measurements of every config.")
+    parser.add_argument('--dry_run', action='store_true', help="Only report, do not update the config.")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries_file)
+    chosen, measurements = tune_search(
+        queries, args.embedder, args.top_k, args.hnsw_ef_values, args.oversampling_values,
+        args.target_recall, args.rounds, args.block_types, args.version
+    )
+    print(f"Chosen search parameters: {json.dumps(chosen)}")
+    if args.report is not None:
+        with open(args.report, 'w') as f:
+            json.dump({"chosen": chosen, "measurements": measurements}, f, indent=2)
+    if not args.dry_run:
+        config_path = args.config or os.getenv(CONFIG_PATH_ENV) or DEFAULT_CONFIG_PATH
+        config = load_config(config_path) if os.path.exists(config_path) else merge_config(DEFAULT_CONFIG, {})
+        config["search"].update(chosen)
+        save_config(config, config_path)
+        print(f"Search parameters written to {config_path}")
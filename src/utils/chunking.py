@@ -0,0 +1,180 @@
+import re
+from collections import deque
+from utils.tokens import count_tokens
+
+ANCHOR_LINK_PATTERN = re.compile(r'\[¶\]\(#?([^)\s]*)\)')
+HEADING_END_CHARACTERS = ".:;,!?)|`"
+
+
+def slugify(text):
+    """Build a documentation-style anchor from a heading, e.g. 'What is a Nanite Mesh?' -> 'whatisananitemesh'."""
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+def parse_heading(line):
+    """Detect a heading line in cleaned documentation text.
+
+    Headings keep their pilcrow anchor link through preprocessing ('Title[¶](#anchor)');
+    short title-like lines without one are also accepted as headings.
+
+    Args:
+        line (str): A line of the cleaned text.
+
+    Returns:
+        tuple: (heading text, anchor), or None if the line is not a heading.
+    """
+    match = ANCHOR_LINK_PATTERN.search(line)
+    if match is not None:
+        return line[:match.start()].strip(), match.group(1)
+    stripped = line.strip()
+    if (
+        0 < len(stripped) <= 80
+        and len(stripped.split()) <= 10
+        and stripped[0].isupper()
+        and '](' not in stripped
+        and stripped[-1] not in HEADING_END_CHARACTERS
+    ):
+        return stripped, slugify(stripped)
+    return None
+
+
+def split_long_line(line, max_tokens):
+    """Split a line that alone exceeds max_tokens into word-aligned pieces."""
+    pieces = []
+    words = []
+    n_tokens = 0
+    for word in line.split(' '):
+        word_tokens = count_tokens(word)
+        if words and n_tokens + word_tokens > max_tokens:
+            pieces.append(' '.join(words))
+            words, n_tokens = [], 0
+        words.append(word)
+        n_tokens += word_tokens
+    if words:
+        pieces.append(' '.join(words))
+    return pieces
+
+
+def chunk_text(text, max_tokens=300, overlap=50, min_tokens=64):
+    """Split a page into token-bounded chunks aligned on its headings.
+
+    Lines are packed greedily into chunks of at most `max_tokens` tokens. A heading
+    closes the current chunk once it holds `min_tokens` tokens, so that chunks follow
+    the sections of the page. When a chunk is closed because it is full, its last
+    lines (up to `overlap` tokens) are repeated at the start of the next one. Headings
+    are never left alone in a chunk: they carry over to the text that follows them.
+    The pilcrow anchor links of the headings are removed from the chunk contents.
+
+    Args:
+        text (str): Cleaned page content, one component per line.
+        max_tokens (int): Maximum number of tokens of a chunk.
+        overlap (int): Maximum number of tokens shared by consecutive chunks of a section.
+        min_tokens (int): Minimum size of a chunk before a heading starts a new one.
+
+    Returns:
+        list of dict: Chunks with "content", "offset" (character offset in `text`) and
+                      "heading" / "anchor" of the nearest heading at or before the chunk (or None).
+    """
+    lines = deque()
+    offset = 0
+    for line in text.split('\n'):
+        if count_tokens(line) > max_tokens:
+            for piece in split_long_line(line, max_tokens):
+                lines.append((offset, piece))
+                offset += len(piece) + 1
+        else:
+            lines.append((offset, line))
+            offset += len(line) + 1
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    heading = None
+
+    def close(keep_overlap):
+        nonlocal current, current_tokens
+        chunks.append({
+            "content": ANCHOR_LINK_PATTERN.sub('', '\n'.join(line for _, line, _, _, _ in current)),
+            "offset": current[0][0],
+            "heading": current[0][2][0] if current[0][2] else None,
+            "anchor": current[0][2][1] if current[0][2] else None,
+        })
+        kept = []
+        kept_tokens = 0
+        if keep_overlap:
+            for entry in reversed(current[1:]):
+                # entry: (offset, line, heading, n_tokens, is_heading)
+                if kept_tokens + entry[3] > overlap:
+                    break
+                kept.insert(0, entry)
+                kept_tokens += entry[3]
+        current, current_tokens = kept, kept_tokens
+
+    while lines:
+        line_offset, line = lines.popleft()
+        n_tokens = count_tokens(line)
+        line_heading = parse_heading(line)
+        if line_heading is not None and current and current_tokens >= min_tokens:
+            close(keep_overlap=False)
+        elif (
+            current and current_tokens + n_tokens > max_tokens
+            and all(entry[4] for entry in current) and current_tokens < max_tokens
+        ):
+            # a chunk of headings only: fill it with the start of the line, the rest comes next
+            first = split_long_line(line, max_tokens - current_tokens)[0]
+            rest = line[len(first) + 1:]
+            if rest:
+                lines.appendleft((line_offset + len(first) + 1, rest))
+            line, n_tokens = first, count_tokens(first)
+        elif current and current_tokens + n_tokens > max_tokens:
+            close(keep_overlap=True)
+            if current_tokens + n_tokens > max_tokens:
+                current, current_tokens = [], 0
+        if line_heading is not None:
+            heading = line_heading
+        current.append((line_offset, line, heading, n_tokens, line_heading is not None))
+        current_tokens += n_tokens
+    # trailing headings have no text to carry over to, e.g. a 'Next' navigation link
+    if current and (not all(entry[4] for entry in current) or not chunks):
+        close(keep_overlap=False)
+    return chunks
+
+
+def chunk_id(url, chunk_index):
+    """Identifier of a chunk, used wherever a subsection url is expected."""
+    return f"{url}#chunk-{chunk_index}"
+
+
+def split_chunk_id(id):
+    """Inverse of chunk_id: (page url, chunk index), the chunk index being None for page urls."""
+    url, separator, chunk_index = id.rpartition("#chunk-")
+    if not separator or not chunk_index.isdigit():
+        return id, None
+    return url, int(chunk_index)
+
+
+def chunk_subsection(url, subsection, max_tokens=300, overlap=50, min_tokens=64):
+    """Split a parsed subsection into chunk subsections.
+
+    Args:
+        url (str): Url of the page.
+        subsection (dict): Subsection with "title" and "content", as produced by parse.py.
+        max_tokens (int): Maximum number of tokens of a chunk.
+        overlap (int): Maximum number of tokens shared by consecutive chunks of a section.
+        min_tokens (int): Minimum size of a chunk before a heading starts a new one.
+
+    Returns:
+        list of tuple: (chunk id, chunk subsection). Chunk subsections hold "title", "content",
+                       "page_url", "section_anchor", "chunk_index" and "offset".
+    """
+    chunks = []
+    for chunk_index, chunk in enumerate(chunk_text(subsection['content'], max_tokens, overlap, min_tokens)):
+        chunks.append((chunk_id(url, chunk_index), {
+            "title": subsection['title'],
+            "content": chunk['content'],
+            "page_url": url,
+            "section_anchor": chunk['anchor'] or subsection['title'],
+            "chunk_index": chunk_index,
+            "offset": chunk['offset'],
+        }))
+    return chunks
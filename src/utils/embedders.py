@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+from utils import metrics
+
+CPU_THREADS_ENV = "UE5_DOCS_CPU_THREADS"
+# backends are loaded once per process, e.g. once for the lifetime of query_server.py
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+
+def select_device():
+    """Pick the torch device: Apple GPU, then CUDA, then CPU."""
+    import torch
+    # set device to gpu if available
+    if (torch.backends.mps.is_available()) and (torch.backends.mps.is_built()):
+        return torch.device("mps")
+    if torch.cuda.is_available():
+        return torch.device("cuda")
+    return torch.device("cpu")
+
+
+class Embedder():
+    """Embedding backend.
+
+    Subclasses declare their model and its properties as class attributes, which are
+    available without loading anything. Heavy dependencies are only imported by `load`,
+    on the first embedding, so a process only pays for the backend it actually uses.
+
+    Attributes:
+        name (str): Name used on the command line, e.g. 'instructor'.
+        model (str): Model name, part of the cache keys of the embeddings.
+        checkpoint (str): Weights to load, when they differ from `model`.
+        dimension (int): Dimension of the embeddings.
+        document_instruction (str): Instruction of documents, or None.
+        query_instruction (str): Instruction of queries, or None.
+        max_batch_size (int): Maximum number of texts per call.
+        max_tokens (int): Maximum number of tokens of a text.
+    """
+    name = None
+    model = None
+    checkpoint = None
+    dimension = None
+    document_instruction = None
+    query_instruction = None
+    max_batch_size = 32
+    max_tokens = 512
+
+    def __init__(self):
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Import the dependencies and load the model, once."""
+        with self.lock:
+            if not self.loaded:
+                with metrics.span("embedder.load"):
+                    self._load()
+                self.loaded = True
+        return self
+
+    def _load(self):
+        raise NotImplementedError
+
+    def embed_documents(self, texts):
+        """Embed documents, by batches of at most max_batch_size.
+
+        Returns:
+            list of list of float: One embedding per text.
+        """
+        self.load()
+        embeddings = []
+        for i in range(0, len(texts), self.max_batch_size):
+            embeddings.extend(self._embed(texts[i:i + self.max_batch_size], self.document_instruction))
+        return embeddings
+
+    def embed_queries(self, texts):
+        """Embed queries, by batches of at most max_batch_size."""
+        self.load()
+        embeddings = []
+        for i in range(0, len(texts), self.max_batch_size):
+            embeddings.extend(self._embed(texts[i:i + self.max_batch_size], self.query_instruction))
+        return embeddings
+
+    def _embed(self, texts, instruction):
+        raise NotImplementedError
+
+
+class InstructorEmbedder(Embedder):
+    name = "instructor"
+    model = "hkunlp/instructor-xl"
+    checkpoint = "hkunlp/instructor-xl"
+    dimension = 768
+    document_instruction = "Represent the UnrealEngine documentation for retrieval:"
+    query_instruction = "Represent the UnrealEngine query for retrieving supporting documents:"
+    max_batch_size = 128
+    max_tokens = 512
+
+    def _load(self):
+        from InstructorEmbedding import INSTRUCTOR
+        self.device = select_device()
+        self.instructor_model = INSTRUCTOR(self.checkpoint)
+
+    def _embed(self, texts, instruction):
+        embeddings = self.instructor_model.encode(
+            [[instruction, text] for text in texts],
+            batch_size=len(texts),
+            device=self.device
+        )
+        return [[float(x) for x in embedding] for embedding in embeddings.tolist()]
+
+
+class InstructorInt8Embedder(InstructorEmbedder):
+    """instructor-xl with its Linear layers dynamically quantized to int8, for hosts without a GPU.
+
+    Same instructions and dimension as 'instructor', but a distinct model name so its
+    embeddings never mix with the fp32 ones in the embedding store and query cache.
+    Check its retrieval quality with `python src/benchmark.py parity`.
+    The number of torch threads is read from $UE5_DOCS_CPU_THREADS (default: torch's own).
+    """
+    name = "instructor-int8"
+    model = "hkunlp/instructor-xl+int8"
+
+    def _load(self):
+        import torch
+        from InstructorEmbedding import INSTRUCTOR
+        threads = os.getenv(CPU_THREADS_ENV)
+        if threads:
+            torch.set_num_threads(int(threads))
+        # quantized kernels only run on the cpu
+        self.device = torch.device("cpu")
+        model = INSTRUCTOR(self.checkpoint, device="cpu")
+        model.eval()
+        self.instructor_model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OpenAIEmbedder(Embedder):
+    name = "openai"
+    model = "text-embedding-ada-002"
+    dimension = 1536
+    # inputs per request accepted by the embeddings endpoint
+    max_batch_size = 2048
+    max_tokens = 8191
+
+    def _load(self):
+        import openai
+        # Fetch API key from environment variable or prompt user for it
+        api_key = os.getenv('API_KEY')
+        if api_key is None:
+            api_key = input("Please enter your OpenAI API key: ")
+        openai.api_key = api_key
+        self.openai = openai
+
+    def _embed(self, texts, instruction):
+        response = self.openai.Embedding.create(input=texts, model=self.model)
+        # the api does not guarantee the order of the returned embeddings
+        data = sorted(response['data'], key=lambda item: item['index'])
+        return [item['embedding'] for item in data]
+
+
+EMBEDDERS = {
+    embedder.name: embedder for embedder in (InstructorEmbedder, InstructorInt8Embedder, OpenAIEmbedder)
+}
+
+
+def register_embedder(embedder_class):
+    """Make a new Embedder subclass available by its name."""
+    EMBEDDERS[embedder_class.name] = embedder_class
+    return embedder_class
+
+
+def get_embedder(name):
+    """Return the backend of an embedder. It is shared by the whole process and only loaded on first use.
+
+    Raises:
+        ValueError: If no embedder has this name.
+    """
+    if name not in EMBEDDERS:
+        raise ValueError(f"Embedder must be one of {sorted(EMBEDDERS)}. Not {name}")
+    with _embedders_lock:
+        if name not in _embedders:
+            _embedders[name] = EMBEDDERS[name]()
+        return _embedders[name]
+
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from utils.embedders import get_embedder
+embedder = get_embedder(sys.argv[1])
+imported = time.perf_counter()
+embedder.load()
+loaded = time.perf_counter()
+embedder.embed_queries(["How do I enable Nanite on a static mesh?"])
+embedded = time.perf_counter()
+print(json.dumps({"import": imported - start, "load": loaded - imported, "first_query": embedded - loaded}))
+"""
+
+
+def startup_benchmark(names):
+    """Measure the cold start of every backend, each in a fresh interpreter.
+
+    Args:
+        names (list of str): Embedders to measure.
+
+    Returns:
+        dict: name -> {"import", "load", "first_query"} seconds, or {"error"} if it failed.
+    """
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    for name in names:
+        process = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, name], cwd=src_dir, capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            results[name] = {"error": process.stderr.strip().splitlines()[-1]}
+        else:
+            results[name] = json.loads(process.stdout.strip().splitlines()[-1])
+    return results
+
+
+def report_startup_benchmark(names):
+    """Run startup_benchmark and print one line per backend."""
+    results = startup_benchmark(names)
+    for name, timings in results.items():
+        if "error" in timings:
+            print(f"{name: <20} failed: {timings['error']}")
+        else:
+            print(f"{name: <20} import {timings['import']:7.3f}s  load {timings['load']:7.3f}s  "
+                  f"first query {timings['first_query']:7.3f}s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start time of the embedding backends.")
+    parser.add_argument('--embedders', type=str, nargs='+', default=sorted(EMBEDDERS))
+    args = parser.parse_args()
+    report_startup_benchmark(args.embedders)
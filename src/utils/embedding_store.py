@@ -0,0 +1,241 @@
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+
+STORE_EXTENSIONS = (".f32", ".index.jsonl", ".meta.json", ".json", ".pkl")
+
+
+def store_prefix(path):
+    """Strip any store or legacy extension from an embeddings path.
+
+    Args:
+        path (str): e.g. './embeddings/instructor_embeddings.json'.
+
+    Returns:
+        str: The store prefix, e.g. './embeddings/instructor_embeddings'.
+    """
+    for extension in STORE_EXTENSIONS:
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+
+def content_key(embedder, model, instruction, text):
+    """Cache key of an embedding: it changes whenever the embedded text or the way it is embedded changes.
+
+    Args:
+        embedder (str): Embedder name, e.g. 'instructor'.
+        model (str): Model name, e.g. 'hkunlp/instructor-xl'.
+        instruction (str, optional): Instruction prepended by the model, if any.
+        text (str): Embedded text.
+
+    Returns:
+        str: sha256 hex digest.
+    """
+    return hashlib.sha256(json.dumps([embedder, model, instruction, text]).encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore():
+    """Append-only on-disk store of embeddings.
+
+    Vectors are stored as a raw float32 matrix that can be memory-mapped, next to a
+    JSON lines index holding the url and title of every row. The meta file is written
+    last on every flush and records the number of committed rows, so rows written by
+    an interrupted flush are discarded on the next open. Compacting writes the matrix
+    and index of a new generation next to the current ones and switches to them by
+    rewriting the meta file, so a crash leaves either the old or the new store.
+
+    Layout:
+        <prefix>[.<generation>].f32          float32 matrix, one row per embedding
+        <prefix>[.<generation>].index.jsonl  {"url", "title", "key"} per row
+        <prefix>.meta.json                   {"dim", "count", "generation"}
+
+    Args:
+        path (str): Store prefix. Legacy '.json' / '.pkl' paths are accepted.
+    """
+    def __init__(self, path):
+        self.prefix = store_prefix(path)
+        self.meta_path = self.prefix + ".meta.json"
+        self._set_generation(0)
+
+        self.dim = None
+        self.count = 0
+        self.rows = []
+        self.url_to_row = {}
+        self.pending_vectors = []
+        self.pending_rows = []
+        self.index_size = 0
+        self._vectors = None
+        if os.path.exists(self.meta_path):
+            self._load_index()
+
+    def _set_generation(self, generation):
+        self.generation = generation
+        data_prefix = f"{self.prefix}.{generation}" if generation else self.prefix
+        self.matrix_path = data_prefix + ".f32"
+        self.index_path = data_prefix + ".index.jsonl"
+
+    def _load_index(self):
+        with open(self.meta_path, 'r') as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        self._set_generation(meta.get("generation", 0))
+        with open(self.index_path, 'rb') as f:
+            for line in f:
+                if len(self.rows) == self.count:
+                    break
+                self.rows.append(json.loads(line))
+                self.index_size += len(line)
+        for row, record in enumerate(self.rows):
+            self.url_to_row[record["url"]] = row
+
+    def exists(self):
+        return os.path.exists(self.meta_path)
+
+    def __len__(self):
+        return self.count + len(self.pending_rows)
+
+    def __contains__(self, url):
+        return url in self.url_to_row
+
+    def add(self, url, title, embedding, key=None):
+        """Buffer a new embedding. It is written to disk by the next flush.
+
+        Args:
+            url (str): Url of the embedded subsection.
+            title (str): Title of the embedded subsection.
+            embedding (list of float): The embedding.
+            key (str, optional): content_key of the embedded text.
+        """
+        if self.dim is None:
+            self.dim = len(embedding)
+        elif len(embedding) != self.dim:
+            raise ValueError(f"Embedding has dimension {len(embedding)}, store has dimension {self.dim}")
+        self.url_to_row[url] = len(self)
+        self.pending_rows.append({"url": url, "title": title, "key": key})
+        self.pending_vectors.append(embedding)
+
+    def flush(self):
+        """Append buffered embeddings to disk. Only new rows are written."""
+        if not self.pending_rows:
+            return
+        os.makedirs(os.path.dirname(self.prefix) or ".", exist_ok=True)
+        committed_bytes = self.count * self.dim * 4
+        vectors = np.asarray(self.pending_vectors, dtype=np.float32)
+
+        # drop leftovers of an interrupted flush before appending
+        with open(self.matrix_path, 'ab') as f:
+            f.truncate(committed_bytes)
+            f.write(vectors.tobytes())
+        index_lines = "".join(json.dumps(record) + "\n" for record in self.pending_rows).encode('utf-8')
+        with open(self.index_path, 'ab') as f:
+            f.truncate(self.index_size)
+            f.write(index_lines)
+        self.index_size += len(index_lines)
+
+        self.rows.extend(self.pending_rows)
+        self.count += len(self.pending_rows)
+        self.pending_rows = []
+        self.pending_vectors = []
+        self._vectors = None
+        self._write_meta()
+
+    def _write_meta(self):
+        # the meta file commits the rows written before it
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"dim": self.dim, "count": self.count, "generation": self.generation}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def vectors(self):
+        """Memory-map the committed embeddings.
+
+        Returns:
+            np.ndarray: Read-only (count, dim) float32 matrix backed by the store file.
+        """
+        if self.count == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        if self._vectors is None:
+            self._vectors = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(self.count, self.dim))
+        return self._vectors
+
+    def compact(self, keep_rows):
+        """Rewrite the store with only the given committed rows, dropping all others.
+
+        The rows are written as a new generation of the matrix and index files, which
+        the meta file switches to. The previous generation is deleted afterwards.
+
+        Args:
+            keep_rows (list of int): Committed rows to keep, in their new order.
+        """
+        self.flush()
+        vectors = np.asarray(self.vectors()[keep_rows], dtype=np.float32)
+        rows = [self.rows[row] for row in keep_rows]
+        index_lines = "".join(json.dumps(record) + "\n" for record in rows).encode('utf-8')
+        self._vectors = None
+        old_paths = (self.matrix_path, self.index_path)
+
+        # leftovers of a compaction interrupted before its meta file are overwritten
+        self._set_generation(self.generation + 1)
+        with open(self.matrix_path, 'wb') as f:
+            f.write(vectors.tobytes())
+            os.fsync(f.fileno())
+        with open(self.index_path, 'wb') as f:
+            f.write(index_lines)
+            os.fsync(f.fileno())
+
+        self.rows = rows
+        self.count = len(rows)
+        self.index_size = len(index_lines)
+        self.url_to_row = {record["url"]: row for row, record in enumerate(rows)}
+        self._write_meta()
+        for path in old_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def key(self, url):
+        """Return the content key of a committed url, or None if unknown."""
+        row = self.url_to_row.get(url)
+        if row is None or row >= self.count:
+            return None
+        return self.rows[row].get("key")
+
+    def get(self, url):
+        """Return (title, vector) of a committed url, or None if it is not in the store."""
+        row = self.url_to_row.get(url)
+        if row is None or row >= self.count:
+            return None
+        return self.rows[row]["title"], self.vectors()[row]
+
+
+def convert_json_embeddings(json_path, path=None):
+    """Convert a legacy `{embedder}_embeddings.json` file to an EmbeddingStore.
+
+    Args:
+        json_path (str): Path to the legacy json embeddings.
+        path (str, optional): Prefix of the new store. Defaults to the json path without extension.
+
+    Returns:
+        EmbeddingStore: The new store.
+    """
+    with open(json_path, 'r') as f:
+        embeddings = json.load(f)
+    store = EmbeddingStore(path or json_path)
+    if store.exists():
+        raise FileExistsError(f"An embedding store already exists at {store.prefix}")
+    for url, content in embeddings.items():
+        store.add(url, content["title"], content["embedding"])
+    store.flush()
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert legacy json embeddings to the binary embedding store.")
+    parser.add_argument('--json_path', type=str, default='./embeddings/instructor_embeddings.json')
+    parser.add_argument('--store_path', type=str, default=None)
+    args = parser.parse_args()
+    store = convert_json_embeddings(args.json_path, args.store_path)
+    print(f"Converted {len(store)} embeddings of dimension {store.dim} to {store.matrix_path}")
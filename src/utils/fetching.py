@@ -0,0 +1,225 @@
+import gzip
+import http.client
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError, HTTPError
+from urllib.parse import urlsplit, urljoin
+from utils import metrics
+
+USER_AGENT = f"Python-urllib/{sys.version_info.major}.{sys.version_info.minor}"
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+Response = namedtuple("Response", ["url", "status", "headers", "body"])
+
+
+class HostRateLimiter():
+    """Spaces out requests so that each host receives at most `rate_limit` requests per second."""
+    def __init__(self, rate_limit=None):
+        self.interval = 1.0 / rate_limit if rate_limit else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, host):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ConnectionPool():
+    """Keep-alive HTTP(S) connections, one per (thread, host).
+
+    http.client connections are not thread safe, so each worker thread keeps its own
+    connection to every host it talks to and reuses it for as long as the server allows.
+    """
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.all_connections = []
+
+    def _connections(self):
+        if not hasattr(self.local, "connections"):
+            self.local.connections = {}
+        return self.local.connections
+
+    def _get(self, scheme, netloc):
+        connections = self._connections()
+        key = (scheme, netloc)
+        if key not in connections:
+            if scheme == "https":
+                connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            connections[key] = connection
+            with self.lock:
+                self.all_connections.append(connection)
+        return connections[key]
+
+    def _discard(self, scheme, netloc):
+        connection = self._connections().pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def request(self, url, headers=None):
+        """Send a GET request on a pooled connection.
+
+        Args:
+            url (str): Url to request.
+            headers (dict, optional): Extra request headers.
+
+        Returns:
+            tuple: (status, headers, body) of the response. The body is decompressed if needed.
+
+        Raises:
+            URLError: If the server could not be reached, the connection broke or the body could not be decompressed.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise URLError(f"unknown url type: {url!r}")
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        request_headers = {
+            "User-Agent": USER_AGENT,
+            "Accept-Encoding": "gzip",
+        }
+        if headers:
+            request_headers.update(headers)
+
+        connection = self._get(parts.scheme, parts.netloc)
+        try:
+            connection.request("GET", path, headers=request_headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError) as e:
+            self._discard(parts.scheme, parts.netloc)
+            raise URLError(e)
+
+        if response.will_close:
+            self._discard(parts.scheme, parts.netloc)
+        if response.getheader("Content-Encoding") == "gzip":
+            # a truncated or mislabeled body fails like a broken connection, and is retried
+            try:
+                body = gzip.decompress(body)
+            except (OSError, EOFError, zlib.error) as e:
+                raise URLError(f"invalid gzip body: {e}")
+        return response.status, response.headers, body
+
+    def close(self):
+        with self.lock:
+            for connection in self.all_connections:
+                connection.close()
+            self.all_connections = []
+
+
+class Fetcher():
+    """Concurrent page fetcher with connection pooling, per-host rate limiting and retries.
+
+    Args:
+        concurrency (int): Maximum number of requests in flight.
+        rate_limit (float, optional): Maximum number of requests per second sent to a single host.
+                                      None disables rate limiting.
+        retries (int): Number of retries on connection errors, 429 and 5xx responses.
+        backoff (float): Base delay in seconds of the exponential backoff between retries.
+        timeout (float): Socket timeout in seconds.
+        max_redirects (int): Maximum number of redirects to follow.
+    """
+    def __init__(
+            self,
+            concurrency=8,
+            rate_limit=None,
+            retries=3,
+            backoff=0.5,
+            timeout=30,
+            max_redirects=5
+            ):
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_redirects = max_redirects
+        self.rate_limiter = HostRateLimiter(rate_limit)
+        self.pool = ConnectionPool(timeout=timeout)
+
+    def _request(self, url, headers=None):
+        for _ in range(self.max_redirects + 1):
+            self.rate_limiter.wait(urlsplit(url).netloc)
+            status, response_headers, body = self.pool.request(url, headers)
+            if status in REDIRECT_CODES and response_headers.get("Location"):
+                url = urljoin(url, response_headers["Location"])
+                continue
+            if status >= 400:
+                raise HTTPError(url, status, http.client.responses.get(status, ""), response_headers, None)
+            return Response(url, status, response_headers, body)
+        raise HTTPError(url, status, "Too many redirects", response_headers, None)
+
+    def fetch(self, url, headers=None):
+        """Fetch a single url, retrying transient failures with exponential backoff.
+
+        Args:
+            url (str): Url to fetch.
+            headers (dict, optional): Extra request headers.
+
+        Returns:
+            Response: The final response. 304 responses are returned, not raised.
+
+        Raises:
+            HTTPError: If the server answered with an error status.
+            URLError: If the server could not be reached.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.span("fetch"):
+                    return self._request(url, headers)
+            except HTTPError as e:
+                if (e.code != 429 and e.code < 500) or attempt == self.retries:
+                    raise
+            except URLError:
+                if attempt == self.retries:
+                    raise
+            metrics.increment("fetch_retries")
+            time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+    def _fetch_safe(self, url, headers=None):
+        try:
+            return url, self.fetch(url, headers), None
+        except URLError as e:
+            return url, None, e
+
+    def fetch_all(self, urls, headers=None):
+        """Fetch urls concurrently.
+
+        Only a bounded window of urls is in flight or waiting to be consumed, so a slow
+        consumer does not make the fetched pages pile up in memory.
+
+        Args:
+            urls (iterable of str): Urls to fetch.
+            headers (callable, optional): Function mapping a url to extra request headers,
+                                          e.g. conditional request validators.
+
+        Yields:
+            tuple: (url, response, error) in the order of `urls`. `response` is a Response,
+                   or None if `error` (an HTTPError or URLError) is set.
+        """
+        def fetch_one(url):
+            return self._fetch_safe(url, headers(url) if headers is not None else None)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = deque()
+            for url in urls:
+                while len(in_flight) >= 2 * self.concurrency:
+                    yield in_flight.popleft().result()
+                in_flight.append(executor.submit(fetch_one, url))
+            while in_flight:
+                yield in_flight.popleft().result()
+        self.pool.close()
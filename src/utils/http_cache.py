@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+
+class HttpCache():
+    """Persistent, content-addressed cache of fetched documentation pages.
+
+    Raw response bodies are stored under the sha256 of the body, and their cleaned text
+    under that hash and the version of the parser that produced it,
+    and an index maps every url to the hash of its last body plus the validators
+    (ETag / Last-Modified) needed to send conditional requests on the next run.
+
+    Layout:
+        <cache_dir>/index.json                            url -> {"sha256", "etag", "last_modified"}
+        <cache_dir>/objects/<sha256>.html                 raw response body
+        <cache_dir>/parsed/<sha256>.<parser_version>.txt  output of split_text_into_components
+
+    Args:
+        cache_dir (str): Directory of the cache. Created if it does not exist.
+        parser_version (str): Version of the cleaned text, e.g. parse.parser_version(). Text
+                              cleaned by another version is never returned.
+    """
+    def __init__(self, cache_dir, parser_version):
+        self.cache_dir = cache_dir
+        self.parser_version = parser_version
+        self.index_path = os.path.join(cache_dir, "index.json")
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "parsed"), exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def _object_path(self, sha256):
+        return os.path.join(self.cache_dir, "objects", f"{sha256}.html")
+
+    def _parsed_path(self, sha256):
+        return os.path.join(self.cache_dir, "parsed", f"{sha256}.{self.parser_version}.txt")
+
+    def conditional_headers(self, url):
+        """Build the conditional request headers for a url.
+
+        Args:
+            url (str): Url about to be fetched.
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers, empty if the url is not cached.
+        """
+        entry = self.index.get(url)
+        if entry is None or not os.path.exists(self._object_path(entry["sha256"])):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, url, response):
+        """Record a response and resolve its body.
+
+        Args:
+            url (str): Url that was fetched.
+            response (Response): Response returned by the fetcher. May be a 304.
+
+        Returns:
+            tuple: (body, changed) where body is the raw page and changed is False if the
+                   server answered 304 or returned the same body as the previous run.
+        """
+        entry = self.index.get(url)
+        if response.status == 304 and entry is not None:
+            with open(self._object_path(entry["sha256"]), 'rb') as f:
+                return f.read(), False
+
+        body = response.body
+        sha256 = hashlib.sha256(body).hexdigest()
+        changed = entry is None or entry["sha256"] != sha256
+        object_path = self._object_path(sha256)
+        if not os.path.exists(object_path):
+            with open(object_path, 'wb') as f:
+                f.write(body)
+        self.index[url] = {
+            "sha256": sha256,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        return body, changed
+
+    def get_parsed(self, url):
+        """Return the cleaned text of the cached body of a url, or None if it was never parsed."""
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        parsed_path = self._parsed_path(entry["sha256"])
+        if not os.path.exists(parsed_path):
+            return None
+        with open(parsed_path, 'r') as f:
+            return f.read()
+
+    def set_parsed(self, url, content):
+        """Store the cleaned text of the current body of a url."""
+        with open(self._parsed_path(self.index[url]["sha256"]), 'w') as f:
+            f.write(content)
+
+    def save(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
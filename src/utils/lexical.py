@@ -0,0 +1,200 @@
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from utils.numpy_search import Hit, search_payload
+from utils.subsections_io import iter_subsections
+
+DEFAULT_LEXICAL_INDEX_PATH = "./indexes/lexical_index.json"
+# identifiers, dotted names (r.Nanite.MaxPixelsPerEdge) and C++ scopes (UWorld::SpawnActor)
+CODE_TOKEN_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*(?:(?:\.|::)[A-Za-z_][A-Za-z0-9_]*)*|\d+(?:\.\d+)*')
+CAMEL_CASE_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+IDENTIFIER_QUERY_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(?:(?:\.|::)[A-Za-z_][A-Za-z0-9_]*)*$')
+
+
+def tokenize_code(text):
+    """Split text into lowercased terms, keeping code identifiers searchable.
+
+    Every identifier yields itself and its parts: 'r.Nanite.MaxPixelsPerEdge' gives
+    'r.nanite.maxpixelsperedge', 'nanite', 'maxpixelsperedge', 'max', 'pixels', 'per',
+    'edge', and 'UCharacterMovementComponent' gives 'ucharactermovementcomponent',
+    'character', 'movement', 'component'. Single letter parts are dropped.
+
+    Args:
+        text (str): Text or query.
+
+    Returns:
+        list of str: Terms, with repetitions.
+    """
+    terms = []
+    for token in CODE_TOKEN_PATTERN.findall(text):
+        terms.append(token.lower())
+        parts = re.split(r'\.|::|_', token)
+        if len(parts) > 1:
+            terms.extend(part.lower() for part in parts if len(part) > 1)
+        for part in parts:
+            words = CAMEL_CASE_PATTERN.findall(part)
+            if len(words) > 1:
+                terms.extend(word.lower() for word in words if len(word) > 1)
+    return terms
+
+
+def is_lexical_query(query):
+    """Whether a query looks like a UE identifier or console variable rather than a question.
+
+    e.g. 'UCharacterMovementComponent', 'r.Nanite', 'UWorld::SpawnActor' or 'bUseControllerRotationYaw'.
+    """
+    query = query.strip()
+    if not IDENTIFIER_QUERY_PATTERN.match(query):
+        return False
+    return '.' in query or '::' in query or '_' in query or re.search(r'[a-z][A-Z]|^[A-Z]{2,}[a-z]', query) is not None
+
+
+class BM25Index():
+    """Inverted index of the subsections with BM25 scoring.
+
+    Args:
+        k1 (float): Term frequency saturation.
+        b (float): Document length normalization.
+    """
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.payloads = []
+        self.doc_lengths = []
+        self.postings = defaultdict(list)
+        self.chunked = False
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def add(self, payload, text):
+        """Index a document.
+
+        Args:
+            payload (dict): Returned with the hits of the document.
+            text (str): Indexed text.
+        """
+        doc = len(self.payloads)
+        terms = Counter(tokenize_code(text))
+        for term, tf in terms.items():
+            self.postings[term].append((doc, tf))
+        self.payloads.append(payload)
+        self.doc_lengths.append(sum(terms.values()))
+        self.chunked = self.chunked or "chunk_index" in payload
+
+    def search(self, query, limit, block_types=None, versions=None, doc_areas=None):
+        """Return the `limit` best BM25 hits of a query, sorted by decreasing score.
+
+        Args:
+            query (str): The query.
+            limit (int): Number of hits.
+            block_types (list of str, optional): Only return these block types.
+            versions (list of str, optional): Only return these engine versions.
+            doc_areas (list of str, optional): Only return these documentation areas.
+
+        Returns:
+            list of Hit: Hits with the payload and BM25 score of the matching documents.
+        """
+        n_docs = len(self.payloads)
+        if n_docs == 0:
+            return []
+        average_length = sum(self.doc_lengths) / n_docs
+        scores = defaultdict(float)
+        for term in set(tokenize_code(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc] / average_length)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        hits = []
+        for doc, score in sorted(scores.items(), key=lambda item: -item[1]):
+            payload = self.payloads[doc]
+            if block_types and payload["block_type"] not in block_types:
+                continue
+            if versions and payload["version"] not in versions:
+                continue
+            # indexes built before doc areas existed have none
+            if doc_areas and payload.get("doc_area") not in doc_areas:
+                continue
+            hits.append(Hit(payload, score))
+            if len(hits) == limit:
+                break
+        return hits
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", 'w') as f:
+            json.dump({
+                "k1": self.k1,
+                "b": self.b,
+                "payloads": self.payloads,
+                "doc_lengths": self.doc_lengths,
+                "postings": self.postings,
+            }, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        index = cls(data["k1"], data["b"])
+        index.payloads = data["payloads"]
+        index.doc_lengths = data["doc_lengths"]
+        index.chunked = any("chunk_index" in payload for payload in index.payloads)
+        index.postings = {term: [tuple(posting) for posting in postings] for term, postings in data["postings"].items()}
+        return index
+
+
+def build_lexical_index(content_path, index_path=DEFAULT_LEXICAL_INDEX_PATH):
+    """Build the BM25 index of the subsections (or chunks) and save it.
+
+    Args:
+        content_path (str): subsections.json(l) from parse.py, or chunks from chunk.py.
+        index_path (str): Output path of the index.
+
+    Returns:
+        BM25Index: The index.
+    """
+    index = BM25Index()
+    for url, subsection in iter_subsections(content_path):
+        # titles hold the page slug, e.g. 'character-movement-component-in-unreal-engine'
+        index.add(search_payload(url, subsection, subsection['title']), f"{subsection['title']}\n{subsection['content']}")
+    index.save(index_path)
+    return index
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=60):
+    """Fuse several rankings of hits with reciprocal rank fusion.
+
+    Args:
+        rankings (list of list): Hits (with .payload and .score) of every ranking, best first.
+        top_k (int): Number of hits to return.
+        k (int): Damping of the rank contributions.
+
+    Returns:
+        list of Hit: Fused hits, their score being the fused score.
+    """
+    scores = defaultdict(float)
+    payloads = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            key = (hit.payload["url"], hit.payload["section_anchor"])
+            scores[key] += 1 / (k + rank + 1)
+            payloads.setdefault(key, hit.payload)
+    fused = sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+    return [Hit(payloads[key], score) for key, score in fused]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the BM25 lexical index of the subsections.")
+    parser.add_argument('--content_path', type=str, default='./documents/subsections.json')
+    parser.add_argument('--index_path', type=str, default=DEFAULT_LEXICAL_INDEX_PATH)
+    args = parser.parse_args()
+    index = build_lexical_index(args.content_path, args.index_path)
+    print(f"Indexed {len(index)} subsections, {len(index.postings)} terms, to {args.index_path}")
@@ -0,0 +1,237 @@
+import atexit
+import contextlib
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+METRICS_ENV = "UE5_DOCS_METRICS"
+METRIC_PREFIX = "ue5_docs"
+# prometheus files are rewritten at most this often, and at exit
+FLUSH_INTERVAL = 5.0
+METRIC_NAME_PATTERN = re.compile(r'[^a-zA-Z0-9_]')
+
+_recorder = None
+_recorder_lock = threading.Lock()
+# returned by span() when metrics are disabled
+_NO_SPAN = contextlib.nullcontext()
+
+
+class MetricsRecorder():
+    """Timing spans and counters of one process.
+
+    Spans are aggregated by name (count, total and max seconds) and counters summed.
+    With a path, they are exported either as json lines (one line per span as it ends,
+    and a line with the running totals of the counters whenever they changed, at most
+    every FLUSH_INTERVAL seconds and at exit) or, for paths ending in .prom, as a Prometheus
+    text file rewritten on flush, e.g. for the node exporter's textfile collector.
+
+    Args:
+        path (str, optional): Output file. None only keeps the metrics in memory.
+        keep_events (bool, optional): Keep every span, not only the aggregates. Defaults to
+            whether the output is json lines.
+    """
+    def __init__(self, path=None, keep_events=None):
+        self.path = path
+        self.prometheus = path is not None and path.endswith(".prom")
+        self.keep_events = path is not None and not self.prometheus if keep_events is None else keep_events
+        self.spans = {}
+        self.counters = {}
+        self.events = []
+        self.last_flush = time.time()
+        # counters of the last json line written, and when
+        self.written_counters = {}
+        self.last_counters_flush = time.time()
+        self.lock = threading.Lock()
+        self.file = None
+
+    def record_span(self, name, seconds):
+        with self.lock:
+            stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            if self.keep_events:
+                self.events.append({"ts": time.time(), "pid": os.getpid(), "span": name, "seconds": seconds})
+        self._maybe_flush()
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._maybe_flush()
+
+    def snapshot(self):
+        """Aggregated spans and counters, e.g. to send them to another process."""
+        with self.lock:
+            return {
+                "spans": {name: list(stats) for name, stats in self.spans.items()},
+                "counters": dict(self.counters),
+                "events": list(self.events),
+            }
+
+    def merge(self, snapshot):
+        """Add the spans and counters of another recorder's snapshot."""
+        with self.lock:
+            for name, (count, total, longest) in snapshot["spans"].items():
+                stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += count
+                stats[1] += total
+                stats[2] = max(stats[2], longest)
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            if self.keep_events:
+                self.events.extend(snapshot["events"])
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self.path is None:
+            return
+        now = time.time()
+        if self.prometheus:
+            if now - self.last_flush >= FLUSH_INTERVAL:
+                self.flush()
+        elif self.events or now - self.last_counters_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self, final=False):
+        """Write the metrics to the output file.
+
+        Args:
+            final (bool): Write the counters of a json lines output even if FLUSH_INTERVAL has not elapsed.
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            self.last_flush = time.time()
+            if self.prometheus:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path + ".tmp", 'w') as f:
+                    f.write(self.prometheus_text())
+                os.replace(self.path + ".tmp", self.path)
+                return
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self.file = open(self.path, 'a')
+            for event in self.events:
+                self.file.write(json.dumps(event) + "\n")
+            self.events = []
+            # running totals, so the last counters line of a process holds all of them
+            counters_due = final or self.last_flush - self.last_counters_flush >= FLUSH_INTERVAL
+            if counters_due and self.counters != self.written_counters:
+                self.written_counters = dict(self.counters)
+                self.last_counters_flush = self.last_flush
+                self.file.write(json.dumps({"ts": self.last_flush, "pid": os.getpid(), "counters": self.written_counters}) + "\n")
+            self.file.flush()
+
+    def close(self):
+        """Write the last counters, flush and close the output. Runs at exit."""
+        # processes that recorded nothing, e.g. idle workers, leave the output alone
+        if self.path is None or (not self.spans and not self.counters):
+            return
+        self.flush(final=True)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def prometheus_text(self):
+        """Spans as a summary of seconds per span, counters as <prefix>_<name>_total."""
+        lines = []
+        if self.spans:
+            lines.append(f"# TYPE {METRIC_PREFIX}_span_seconds summary")
+            for name, (count, total, _) in sorted(self.spans.items()):
+                lines.append(f'{METRIC_PREFIX}_span_seconds_count{{span="{name}"}} {count}')
+                lines.append(f'{METRIC_PREFIX}_span_seconds_sum{{span="{name}"}} {total}')
+            lines.append(f"# TYPE {METRIC_PREFIX}_span_max_seconds gauge")
+            for name, (_, _, longest) in sorted(self.spans.items()):
+                lines.append(f'{METRIC_PREFIX}_span_max_seconds{{span="{name}"}} {longest}')
+        for name, value in sorted(self.counters.items()):
+            metric = f"{METRIC_PREFIX}_{METRIC_NAME_PATTERN.sub('_', name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def enable(path=None):
+    """Start recording the metrics of this process, exported to `path` (see MetricsRecorder).
+
+    Returns:
+        MetricsRecorder: The recorder.
+    """
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = MetricsRecorder(path)
+            atexit.register(_recorder.close)
+        return _recorder
+
+
+def enabled():
+    return _recorder is not None
+
+
+def get_recorder():
+    """The recorder of this process, or None when metrics are disabled."""
+    return _recorder
+
+
+@contextlib.contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        # read again: a captured call may have swapped the recorder
+        if _recorder is not None:
+            _recorder.record_span(name, time.perf_counter() - start)
+
+
+def span(name):
+    """Context manager timing a block as the span `name`. A shared no-op when metrics are disabled."""
+    if _recorder is None:
+        return _NO_SPAN
+    return _span(name)
+
+
+def timed(name):
+    """Decorator timing every call of a function as the span `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with _span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name, value=1):
+    """Add `value` to the counter `name`, if metrics are enabled."""
+    if _recorder is not None:
+        _recorder.increment(name, value)
+
+
+def run_captured(func, *args):
+    """Call func(*args) with a fresh in-memory recorder. Meant for worker processes, whose metrics would be lost.
+
+    Returns:
+        tuple: (result, snapshot), the snapshot to be merged by the parent with `merge`.
+    """
+    global _recorder
+    previous, _recorder = _recorder, MetricsRecorder(keep_events=True)
+    try:
+        result = func(*args)
+        return result, _recorder.snapshot()
+    finally:
+        _recorder = previous
+
+
+def merge(snapshot):
+    if _recorder is not None:
+        _recorder.merge(snapshot)
+
+
+if os.getenv(METRICS_ENV):
+    enable(os.getenv(METRICS_ENV))
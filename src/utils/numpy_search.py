@@ -0,0 +1,120 @@
+from collections import namedtuple
+import numpy as np
+from utils.embedding_store import EmbeddingStore
+from utils.parsing_preprocessing import extract_doc_area_from_url, extract_version_from_url
+from utils.subsections_io import iter_subsections
+
+# same fields as the Qdrant ScoredPoint used by query_index
+Hit = namedtuple("Hit", ["payload", "score"])
+
+
+def search_payload(url, subsection, title):
+    """Payload of a subsection as used by in-process search, with the fields create_index.py stores in Qdrant.
+
+    Args:
+        url (str): Url (or chunk id) of the subsection.
+        subsection (dict): The subsection, as produced by parse.py or chunk.py.
+        title (str): Its title, used as section anchor of unchunked subsections.
+    """
+    page_url = subsection.get('page_url', url)
+    payload = {
+        "text": subsection['content'],
+        "url": page_url,
+        "section_anchor": subsection.get('section_anchor', title),
+        "block_type": 'text',
+        "version": extract_version_from_url(page_url),
+        "doc_area": extract_doc_area_from_url(page_url),
+    }
+    if 'chunk_index' in subsection:
+        payload["chunk_index"] = subsection['chunk_index']
+    return payload
+
+
+class NumpySearchIndex():
+    """Exact in-process dot-product search over the embedding store, without a Qdrant server.
+
+    Vectors stay memory-mapped from the store written by embed.py. Payloads are rebuilt
+    from the subsections the same way create_index.py builds them, so results and
+    filters match the Qdrant path.
+
+    Args:
+        embeddings_path (str): Prefix of the embedding store, e.g. './embeddings/instructor_embeddings'.
+        content_path (str): Subsections (or chunks) ingested in the collection.
+    """
+    def __init__(self, embeddings_path, content_path):
+        self.store = EmbeddingStore(embeddings_path)
+        if not self.store.exists():
+            raise FileNotFoundError(f"No embedding store at {self.store.prefix}. Run embed.py first.")
+        rows = []
+        self.payloads = []
+        for url, subsection in iter_subsections(content_path):
+            row = self.store.url_to_row.get(url)
+            if row is None or row >= self.store.count:
+                continue
+            rows.append(row)
+            self.payloads.append(search_payload(url, subsection, self.store.rows[row]["title"]))
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.block_types = np.asarray([payload["block_type"] for payload in self.payloads], dtype=object)
+        self.versions = np.asarray([payload["version"] for payload in self.payloads], dtype=object)
+        self.doc_areas = np.asarray([payload["doc_area"] for payload in self.payloads], dtype=object)
+        # chunks of the same page are collapsed after the search
+        self.chunked = any("chunk_index" in payload for payload in self.payloads)
+        # every committed row is searched in place when the store holds exactly the subsections
+        self.contiguous = len(self.rows) == self.store.count and bool(np.all(self.rows == np.arange(len(self.rows))))
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def scores(self, vectors):
+        """Dot products of query vectors with every indexed subsection.
+
+        Args:
+            vectors (np.ndarray): (n_queries, dim) query vectors.
+
+        Returns:
+            np.ndarray: (n_queries, len(self)) float32 scores.
+        """
+        scores = np.asarray(vectors, dtype=np.float32) @ self.store.vectors().T
+        if not self.contiguous:
+            scores = scores[:, self.rows]
+        return scores
+
+    def search(self, vector, limit, block_types=None, versions=None, doc_areas=None):
+        """Return the `limit` best hits of a query vector, sorted by decreasing score.
+
+        Args:
+            vector (list of float): Query vector.
+            limit (int): Number of hits.
+            block_types (list of str, optional): Only return these block types.
+            versions (list of str, optional): Only return these engine versions.
+            doc_areas (list of str, optional): Only return these documentation areas.
+
+        Returns:
+            list of Hit: Hits with the payload and score of the matching subsections.
+        """
+        return self.search_batch([vector], limit, block_types, versions, doc_areas)[0]
+
+    def search_batch(self, vectors, limit, block_types=None, versions=None, doc_areas=None):
+        """Batched `search`: one matrix product for all the queries."""
+        if len(self) == 0:
+            return [[] for _ in vectors]
+        scores = self.scores(vectors)
+        mask = np.ones(len(self), dtype=bool)
+        if block_types:
+            mask &= np.isin(self.block_types, block_types)
+        if versions:
+            mask &= np.isin(self.versions, versions)
+        if doc_areas:
+            mask &= np.isin(self.doc_areas, doc_areas)
+        scores[:, ~mask] = -np.inf
+        limit = min(limit, int(mask.sum()))
+        if limit == 0:
+            return [[] for _ in vectors]
+
+        results = []
+        for query_scores in scores:
+            # O(n) selection of the top hits, then a sort of these only
+            top = np.argpartition(-query_scores, limit - 1)[:limit]
+            top = top[np.argsort(-query_scores[top])]
+            results.append([Hit(self.payloads[i], float(query_scores[i])) for i in top])
+        return results
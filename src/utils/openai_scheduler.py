@@ -0,0 +1,137 @@
+import asyncio
+import random
+import time
+from collections import deque
+import aiohttp
+import openai
+from openai.error import APIConnectionError, APIError, InvalidRequestError, RateLimitError, ServiceUnavailableError, Timeout, TryAgain
+from utils.tokens import count_openai_tokens
+from utils import metrics
+
+RETRYABLE_ERRORS = (APIConnectionError, APIError, RateLimitError, ServiceUnavailableError, Timeout, TryAgain)
+
+
+class MinuteBudget():
+    """Sliding one-minute window limiting both the number of requests and of tokens sent.
+
+    Args:
+        requests_per_minute (int): Maximum number of requests started in any 60s window.
+        tokens_per_minute (int): Maximum number of tokens sent in any 60s window.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = deque()
+        self.window_tokens = 0
+        self.lock = asyncio.Lock()
+
+    def _expire(self, now):
+        while self.window and now - self.window[0][0] >= 60:
+            _, n_tokens = self.window.popleft()
+            self.window_tokens -= n_tokens
+
+    async def acquire(self, n_tokens):
+        """Wait until a request of `n_tokens` tokens fits in the budget, then record it."""
+        # a single request larger than the budget is let through on an empty window
+        n_tokens = min(n_tokens, self.tokens_per_minute)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                if len(self.window) < self.requests_per_minute and self.window_tokens + n_tokens <= self.tokens_per_minute:
+                    self.window.append((now, n_tokens))
+                    self.window_tokens += n_tokens
+                    return
+                await asyncio.sleep(60 - (now - self.window[0][0]))
+
+
+class OpenAIEmbeddingScheduler():
+    """Keeps several batched OpenAI embedding requests in flight within rate limits.
+
+    Requests that hit a rate limit or a transient server error are retried with
+    jittered exponential backoff. A batch rejected as invalid (e.g. an input is too
+    long) is retried text by text so that only the offending inputs are dropped.
+
+    Args:
+        model (str): OpenAI embedding model.
+        max_concurrency (int): Maximum number of requests in flight.
+        requests_per_minute (int): Requests/min budget.
+        tokens_per_minute (int): Tokens/min budget.
+        max_retries (int): Retries of a request on retryable errors.
+        backoff (float): Base delay in seconds of the exponential backoff.
+    """
+    def __init__(
+            self,
+            model,
+            max_concurrency=4,
+            requests_per_minute=3000,
+            tokens_per_minute=1000000,
+            max_retries=6,
+            backoff=1.0
+            ):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    async def _request(self, texts):
+        n_tokens = sum(count_openai_tokens(text, self.model) for text in texts)
+        for attempt in range(self.max_retries + 1):
+            await self.budget.acquire(n_tokens)
+            try:
+                with metrics.span("embed.encode"):
+                    response = await openai.Embedding.acreate(input=texts, model=self.model)
+                # the api does not guarantee the order of the returned embeddings
+                data = sorted(response['data'], key=lambda item: item['index'])
+                return [item['embedding'] for item in data]
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                metrics.increment("openai_retries")
+                delay = self.backoff * 2 ** attempt
+                # honour Retry-After when the server sends one
+                if getattr(e, 'headers', None) and e.headers.get('retry-after'):
+                    delay = max(delay, float(e.headers['retry-after']))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    async def _embed_batch(self, batch):
+        texts = [text for _, text in batch]
+        try:
+            return await self._request(texts), [None] * len(batch)
+        except InvalidRequestError as e:
+            if len(batch) == 1:
+                return [None], [e]
+        embeddings, errors = [], []
+        for item in batch:
+            item_embeddings, item_errors = await self._embed_batch([item])
+            embeddings.extend(item_embeddings)
+            errors.extend(item_errors)
+        return embeddings, errors
+
+    async def run(self, batches, on_result):
+        """Embed all batches.
+
+        Args:
+            batches (list of list): Batches of (item, text) pairs. Items are passed back untouched.
+            on_result (callable): Called as on_result(batch, embeddings, errors) once per batch
+                                  as soon as it completes. `embeddings[i]` is None and
+                                  `errors[i]` holds the InvalidRequestError if text i was rejected.
+        """
+        self.budget = MinuteBudget(self.requests_per_minute, self.tokens_per_minute)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_batch(batch):
+            async with semaphore:
+                embeddings, errors = await self._embed_batch(batch)
+            on_result(batch, embeddings, errors)
+
+        # reuse one pool of connections for every request
+        async with aiohttp.ClientSession() as session:
+            openai.aiosession.set(session)
+            await asyncio.gather(*(run_batch(batch) for batch in batches))
+
+    def embed_batches(self, batches, on_result):
+        """Synchronous entry point of `run`."""
+        asyncio.run(self.run(batches, on_result))
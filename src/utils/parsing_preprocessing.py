@@ -1,5 +1,33 @@
 import re
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
+
+DASH_SEQUENCE_PATTERN = re.compile(r'--+')
+IMAGE_PATTERN = re.compile(r'!\[.+\]\(.*\)')
+HEADER_PATTERN = re.compile(r'# *')
+STARTING_SPECIAL_CHARACTERS_PATTERN = re.compile(r'^[^\w\s]+( *)')
+EXTRA_NEWLINES_PATTERN = re.compile(r'\n{3,}')
+LINK_PATTERN = re.compile(r'\[.*?\]\(.*?\)')
+VERSION_PATTERN = re.compile(r'^\d+\.\d+$')
+LOCALE_PATTERN = re.compile(r'^[a-z]{2}-[a-z]{2}$', re.IGNORECASE)
+# area of the flat manual pages, by the first matching word of their slug
+DOC_AREA_KEYWORDS = (
+    ("release-notes", {"release", "migration"}),
+    ("blueprints", {"blueprint", "blueprints"}),
+    ("scripting", {"python", "scripting", "programming", "api"}),
+    ("animation", {"animation", "animations", "skeletal", "rig", "retargeting", "ik", "metahuman"}),
+    ("cinematics", {"cinematic", "cinematics", "sequencer", "sequence", "movie", "render"}),
+    ("materials", {"material", "materials", "shader", "shaders", "texture", "textures"}),
+    ("rendering", {"lighting", "lumen", "nanite", "shadows", "light", "lights", "post", "ray", "tracing", "rendering"}),
+    ("vfx", {"niagara", "particle", "particles", "effects"}),
+    ("physics", {"physics", "chaos", "collision", "destruction", "cloth"}),
+    ("world-building", {"landscape", "world", "foliage", "level", "levels", "terrain", "water", "procedural"}),
+    ("audio", {"audio", "sound", "metasounds", "metasound"}),
+    ("ui", {"umg", "widget", "widgets", "slate", "interface"}),
+    ("networking", {"networking", "replication", "multiplayer", "server", "online"}),
+    ("platforms", {"android", "ios", "mobile", "console", "linux", "macos", "windows", "xr", "vr", "ar", "virtual"}),
+    ("pipeline", {"datasmith", "import", "importing", "export", "fbx", "usd", "interchange"}),
+    ("setup", {"installing", "install", "hardware", "launcher", "setting", "started", "quick", "projects", "project"}),
+)
 
 def remove_dash_sequences(string):
     """Remove dash sequences from the string.
@@ -10,24 +38,27 @@ def remove_dash_sequences(string):
     Returns:
         str: String with dash sequences removed.
     """
-    pattern = r'-(-+)'  # Negative lookbehind and lookahead to match single dashes
-    result = re.sub(pattern, '', string)
-    return result
+    # single dashes are kept, runs of two or more are dropped
+    if "--" not in string:
+        return string
+    return DASH_SEQUENCE_PATTERN.sub('', string)
 
 def remove_images(string):
-    return re.sub('!\[.+\]\(.*\)', '', string)
+    if "![" not in string:
+        return string
+    return IMAGE_PATTERN.sub('', string)
 
 def remove_header(string):
     if len(string) > 0 and string[0] == "#":
-        return re.sub('#( *)', '', string)
+        return HEADER_PATTERN.sub('', string)
     return string
 
 def remove_starting_special_characters(string):
-    result = re.sub(r'^[^\w\s]+( *)', '', string)
+    result = STARTING_SPECIAL_CHARACTERS_PATTERN.sub('', string, count=1)
     return result
 
 def remove_extra_newlines(string):
-    string = re.sub(r'\n{3,}', '\n\n', string)
+    string = EXTRA_NEWLINES_PATTERN.sub('\n\n', string)
     return string
 
 def remove_bolding(string):
@@ -47,16 +78,45 @@ def remove_links(string):
         str: String with links removed.
             
     """
-    match = re.search('\[.*?\]\(.*?\)', string)
-    if match is not None:
+    if "](" not in string:
+        return string
+    # links are replaced by their text in a single left-to-right scan.
+    # pilcrow anchor links are kept, followed by a copy of themselves.
+    pieces = []
+    position = 0
+    for match in LINK_PATTERN.finditer(string):
         start, end = match.span()
-        link = string[start:end]
+        link = match.group()
         link_text = link[1:].split(']')[0]
         if link_text != "¶":
-            return string[:start] + link_text + remove_links(string[end:])
+            pieces.append(string[position:start])
+            pieces.append(link_text)
         else:
-            return string[:end] + link + remove_links(string[end:])
-    return string
+            pieces.append(string[position:end])
+            pieces.append(link)
+        position = end
+    if position == 0:
+        return string
+    pieces.append(string[position:])
+    return "".join(pieces)
+
+def clean_paragraph(paragraph):
+    """Apply the whole cleaning chain to a single paragraph.
+
+    Args:
+        paragraph (str): Markdown paragraph to clean.
+
+    Returns:
+        str: The cleaned paragraph.
+    """
+    paragraph = remove_dash_sequences(paragraph)
+    paragraph = remove_images(paragraph)
+    paragraph = remove_bolding(paragraph)
+    paragraph = remove_header(paragraph)
+    paragraph = remove_starting_special_characters(paragraph)
+    paragraph = paragraph.strip().replace("\n\n\n", "\n")
+    paragraph = remove_links(paragraph)
+    return paragraph
 
 def split_text_into_components(text):
     """Split the text into components.
@@ -68,26 +128,18 @@ def split_text_into_components(text):
         str: The text split into components.
     """
     components = []
-    paragraphs = text.split('\n\n\n')
     start_saving = False
-    for paragraph in paragraphs:
-        if "\n--" in paragraph:
+    for paragraph in text.split('\n\n\n'):
+        if not start_saving:
+            if "\n--" not in paragraph:
+                continue
             start_saving = True
-        
-        paragraph = remove_dash_sequences(paragraph)
-        paragraph = remove_images(paragraph)
-        paragraph = remove_bolding(paragraph)
-        paragraph = remove_header(paragraph)
-        paragraph = remove_starting_special_characters(paragraph)
-        paragraph = paragraph.strip().replace("\n\n\n", "\n")
-        paragraph = remove_links(paragraph)
-        if paragraph is None:
-            continue
+
+        paragraph = clean_paragraph(paragraph)
         if paragraph.startswith("On this page"):
             continue
-        if start_saving:
-            if len(paragraph) > 0:
-                components.append(paragraph)
+        if len(paragraph) > 0:
+            components.append(paragraph)
 
     return "\n".join(components)
 
@@ -113,6 +165,61 @@ def extract_info_from_url(url):
     return info
 
 
+def extract_version_from_url(url):
+    """Extract the engine version of a documentation url.
+
+    Args:
+        url (str): e.g. 'https://docs.unrealengine.com/5.1/en-US/installing-unreal-engine/'.
+
+    Returns:
+        str: The version, e.g. '5.1', or None if the url has none.
+    """
+    parsed_url = urlparse(url)
+    for part in parsed_url.path.strip('/').split('/'):
+        if VERSION_PATTERN.match(part):
+            return part
+    # dev.epicgames.com pages give it as a query parameter
+    versions = parse_qs(parsed_url.query).get('application_version')
+    return versions[0] if versions else None
+
+
+def extract_doc_area_from_url(url):
+    """Extract the area of the documentation a url belongs to.
+
+    Pages nested under a section after the locale (e.g. '.../en-US/BlueprintAPI/...'),
+    and the section index pages themselves ('.../en-US/BlueprintAPI/'), belong to that
+    section. Other flat pages, like all the pages of urls.txt, get the area
+    of the first keyword of DOC_AREA_KEYWORDS found in their slug, else 'manual'.
+
+    Args:
+        url (str): Url of the page.
+
+    Returns:
+        str: The lowercased section, e.g. 'blueprintapi', an area, e.g. 'animation', or 'manual'.
+    """
+    parts = urlparse(url).path.strip('/').split('/')
+    for i, part in enumerate(parts):
+        if LOCALE_PATTERN.match(part):
+            parts = parts[i + 1:]
+            break
+    # section names are CamelCase, page slugs lowercase and hyphenated
+    if len(parts) > 1 or (parts and '-' not in parts[0] and parts[0] != parts[0].lower()):
+        return parts[0].lower()
+    words = set(parts[0].lower().split('-')) if parts else set()
+    for area, keywords in DOC_AREA_KEYWORDS:
+        if words & keywords:
+            return area
+    return "manual"
+
+
+def with_version(url, version):
+    """Return the url of the same page for another engine version."""
+    parsed_url = urlparse(url)
+    parts = [version if VERSION_PATTERN.match(part) else part for part in parsed_url.path.split('/')]
+    query = re.sub(r'(^|&)application_version=[^&]*', rf'\g<1>application_version={version}', parsed_url.query)
+    return parsed_url._replace(path='/'.join(parts), query=query).geturl()
+
+
 def check_total_number_of_characters(files_dir):
     """Check the total number of characters in the files.
     
@@ -0,0 +1,159 @@
+import re
+import time
+import qdrant_client.http.models as qmodels
+from qdrant_client import grpc
+
+
+def get_aliases(client):
+    """Return the aliases of the Qdrant instance as a dict alias -> collection name."""
+    return {alias.alias_name: alias.collection_name for alias in client.get_aliases().aliases}
+
+
+def get_collection_names(client):
+    return [collection.name for collection in client.get_collections().collections]
+
+
+def resolve_collection_name(client, name):
+    """Return the collection an alias points to, or `name` itself if it is not an alias."""
+    return get_aliases(client).get(name, name)
+
+
+def collection_exists(client, name):
+    """Whether `name` is a collection or an alias of one."""
+    return name in get_collection_names(client) or name in get_aliases(client)
+
+
+def versioned_collection_name(alias):
+    """Name of a new collection version served under `alias`, with millisecond resolution, e.g. 'ue5_docs_20230612153012481'."""
+    now = time.time()
+    return f"{alias}_{time.strftime('%Y%m%d%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}"
+
+
+def list_versions(client, alias):
+    """Return the collection versions built for `alias`, oldest first."""
+    # versions named before millisecond resolution have 14 digits, and sort first within their second
+    pattern = re.compile(rf"^{re.escape(alias)}_\d{{14}}(\d{{3}})?$")
+    return sorted(name for name in get_collection_names(client) if pattern.match(name))
+
+
+def check_alias_free(client, alias, migrate=False):
+    """Raise if a plain collection is named like `alias`, unless it is being migrated to an alias.
+
+    Raises:
+        RuntimeError: If `alias` is a collection (built before aliases were used) and `migrate` is False.
+    """
+    if alias in get_collection_names(client) and not migrate:
+        raise RuntimeError(
+            f"{alias} is a collection, not an alias. Replacing it with an alias deletes it first, so queries "
+            f"fail until the alias exists: pass --migrate_to_alias once to accept this."
+        )
+
+
+def switch_alias(client, alias, collection_name, migrate=False):
+    """Atomically point `alias` to `collection_name`.
+
+    A plain collection named like the alias (built before aliases were used) is only
+    dropped, since Qdrant cannot have both, when `migrate` is set. Queries fail between
+    the deletion and the creation of the alias, which is why it is never implicit.
+
+    Raises:
+        RuntimeError: If `alias` is a collection and `migrate` is False.
+    """
+    check_alias_free(client, alias, migrate)
+    if alias in get_collection_names(client):
+        print(f"Dropping collection {alias} to replace it with an alias.")
+        client.delete_collection(alias)
+    operations = []
+    if alias in get_aliases(client):
+        operations.append(qmodels.DeleteAliasOperation(delete_alias=qmodels.DeleteAlias(alias_name=alias)))
+    operations.append(qmodels.CreateAliasOperation(
+        create_alias=qmodels.CreateAlias(collection_name=collection_name, alias_name=alias)
+    ))
+    # both operations are applied in a single request, so queries never see a missing alias
+    client.update_collection_aliases(change_aliases_operations=operations)
+
+
+def delete_old_versions(client, alias, keep=1):
+    """Delete collection versions of `alias`, except the live one and the `keep` most recent others.
+
+    Returns:
+        list of str: Names of the deleted collections.
+    """
+    live = get_aliases(client).get(alias)
+    others = [name for name in list_versions(client, alias) if name != live]
+    to_delete = others[:max(len(others) - keep, 0)]
+    for name in to_delete:
+        client.delete_collection(name)
+    return to_delete
+
+
+class CollectionCache():
+    """Remembers the collection and alias names of a Qdrant instance for `ttl` seconds.
+
+    Saves a round-trip per query when checking that the searched collection exists.
+    A name missing from the cached list triggers a refresh, so newly created
+    collections are seen at once. Whether a collection holds chunks is cached the same way.
+
+    Args:
+        ttl (float): Seconds before the names are fetched again.
+    """
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self.names = []
+        self.expires_at = 0.0
+        # name -> (expires_at, whether its points are chunks)
+        self.chunked = {}
+
+    def _store(self, names):
+        self.names = names
+        self.expires_at = time.monotonic() + self.ttl
+
+    def get_names(self, client, refresh=False):
+        """Return the collection and alias names, fetched at most once per `ttl`."""
+        if refresh or time.monotonic() >= self.expires_at:
+            self._store(get_collection_names(client) + list(get_aliases(client)))
+        return self.names
+
+    def exists(self, client, name):
+        return name in self.get_names(client) or name in self.get_names(client, refresh=True)
+
+    async def get_names_async(self, client, refresh=False):
+        """Async variant of get_names, over the async gRPC channel of `client`."""
+        if refresh or time.monotonic() >= self.expires_at:
+            collections = await client.async_grpc_collections.List(grpc.ListCollectionsRequest())
+            aliases = await client.async_grpc_collections.ListAliases(grpc.ListAliasesRequest())
+            self._store(
+                [collection.name for collection in collections.collections]
+                + [alias.alias_name for alias in aliases.aliases]
+            )
+        return self.names
+
+    async def exists_async(self, client, name):
+        return name in await self.get_names_async(client) or name in await self.get_names_async(client, refresh=True)
+
+    def is_chunked(self, client, name):
+        """Whether the points of a collection are page chunks from chunk.py, judged on one point."""
+        cached = self.chunked.get(name)
+        if cached is None or time.monotonic() >= cached[0]:
+            points, _ = client.scroll(collection_name=name, limit=1, with_payload=["chunk_index"], with_vectors=False)
+            cached = self.chunked[name] = (time.monotonic() + self.ttl, bool(points) and "chunk_index" in points[0].payload)
+        return cached[1]
+
+    async def is_chunked_async(self, client, name):
+        """Async variant of is_chunked, over the async gRPC channel of `client`."""
+        cached = self.chunked.get(name)
+        if cached is None or time.monotonic() >= cached[0]:
+            response = await client.async_grpc_points.Scroll(grpc.ScrollPoints(
+                collection_name=name,
+                limit=1,
+                with_payload=grpc.WithPayloadSelector(include=grpc.PayloadIncludeSelector(fields=["chunk_index"])),
+                with_vectors=grpc.WithVectorsSelector(enable=False),
+            ))
+            cached = self.chunked[name] = (
+                time.monotonic() + self.ttl, bool(response.result) and "chunk_index" in response.result[0].payload
+            )
+        return cached[1]
+
+    def invalidate(self):
+        self.expires_at = 0.0
+        self.chunked = {}
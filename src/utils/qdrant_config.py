@@ -0,0 +1,140 @@
+import copy
+import json
+import os
+import qdrant_client.http.models as qmodels
+
+CONFIG_PATH_ENV = "UE5_DOCS_QDRANT_CONFIG"
+DEFAULT_CONFIG_PATH = "./config/qdrant.json"
+
+# None leaves the Qdrant default in place
+DEFAULT_CONFIG = {
+    "collection": {
+        "hnsw": {"m": None, "ef_construct": None, "on_disk": None},
+        # null, {"type": "scalar", "quantile": 0.99, "always_ram": true}
+        # or {"type": "product", "compression": "x16", "always_ram": true}
+        "quantization": None,
+        "on_disk_vectors": None,
+        "on_disk_payload": None,
+        "optimizers": {"memmap_threshold": None, "indexing_threshold": None},
+    },
+    "search": {
+        "hnsw_ef": 128,
+        "exact": False,
+        # re-rank quantized hits with the original vectors
+        "rescore": True,
+        # fetch `oversampling` times more quantized hits before re-ranking and truncating them
+        "oversampling": 1.0,
+        "ignore_quantization": False,
+    },
+}
+# path -> (modification time, config) of the files read by load_config_cached
+_config_cache = {}
+
+
+def merge_config(base, override):
+    """Recursively merge `override` into a copy of `base`. None values in `override` are ignored."""
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        elif value is not None:
+            merged[key] = value
+    return merged
+
+
+def config_path(path=None):
+    """Config file read by load_config: `path`, $UE5_DOCS_QDRANT_CONFIG, then ./config/qdrant.json if it exists, else None."""
+    path = path or os.getenv(CONFIG_PATH_ENV)
+    if path is None and os.path.exists(DEFAULT_CONFIG_PATH):
+        path = DEFAULT_CONFIG_PATH
+    return path
+
+
+def load_config(path=None):
+    """Load the Qdrant configuration, on top of DEFAULT_CONFIG.
+
+    Args:
+        path (str, optional): Json config file. Defaults to $UE5_DOCS_QDRANT_CONFIG, then
+                              ./config/qdrant.json if it exists.
+
+    Returns:
+        dict: Configuration with a "collection" and a "search" section.
+    """
+    path = config_path(path)
+    if path is None:
+        return copy.deepcopy(DEFAULT_CONFIG)
+    with open(path, 'r') as f:
+        return merge_config(DEFAULT_CONFIG, json.load(f))
+
+
+def load_config_cached(path=None):
+    """Same as load_config, but the file is only read again when its modification time changes.
+
+    Meant for per-query callers. The returned config is shared and must not be modified.
+    """
+    path = config_path(path)
+    mtime = os.stat(path).st_mtime_ns if path is not None else None
+    cached = _config_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _config_cache[path] = (mtime, load_config(path))
+    return cached[1]
+
+
+def save_config(config, path=DEFAULT_CONFIG_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # replaced at once, so that running query servers never read a half-written file
+    with open(path + ".tmp", 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def quantization_config(quantization):
+    """Build the Qdrant quantization config of the "quantization" entry of the collection section."""
+    if not quantization:
+        return None
+    if quantization["type"] == "scalar":
+        return qmodels.ScalarQuantization(scalar=qmodels.ScalarQuantizationConfig(
+            type=qmodels.ScalarType.INT8,
+            quantile=quantization.get("quantile"),
+            always_ram=quantization.get("always_ram"),
+        ))
+    if quantization["type"] == "product":
+        return qmodels.ProductQuantization(product=qmodels.ProductQuantizationConfig(
+            compression=qmodels.CompressionRatio(quantization.get("compression", "x16")),
+            always_ram=quantization.get("always_ram"),
+        ))
+    raise ValueError(f"Unknown quantization type {quantization['type']}. Must be 'scalar' or 'product'.")
+
+
+def collection_params(config, dimension, distance):
+    """Keyword arguments of `QdrantClient.recreate_collection` for the "collection" section.
+
+    Args:
+        config (dict): Configuration, as returned by load_config.
+        dimension (int): Dimension of the vectors.
+        distance (Distance): Distance of the collection.
+
+    Returns:
+        dict: vectors_config, hnsw_config, optimizers_config, quantization_config and on_disk_payload.
+    """
+    collection = config["collection"]
+    return {
+        "vectors_config": qmodels.VectorParams(size=dimension, distance=distance, on_disk=collection["on_disk_vectors"]),
+        "hnsw_config": qmodels.HnswConfigDiff(**collection["hnsw"]),
+        "optimizers_config": qmodels.OptimizersConfigDiff(**collection["optimizers"]),
+        "quantization_config": quantization_config(collection["quantization"]),
+        "on_disk_payload": collection["on_disk_payload"],
+    }
+
+
+def search_params(config):
+    """Build the Qdrant SearchParams of the "search" section."""
+    search = config["search"]
+    return qmodels.SearchParams(
+        hnsw_ef=search["hnsw_ef"],
+        exact=search["exact"],
+        quantization=qmodels.QuantizationSearchParams(
+            ignore=search["ignore_quantization"],
+            rescore=search["rescore"],
+        ),
+    )
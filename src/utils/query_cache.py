@@ -0,0 +1,114 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from utils.embedding_store import content_key
+
+QUERY_CACHE_ENV = "UE5_DOCS_QUERY_CACHE"
+DEFAULT_QUERY_CACHE_PATH = "./cache/query_embeddings.sqlite"
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_query(query):
+    """Queries differing only by case or whitespace share their cached embedding."""
+    return WHITESPACE_PATTERN.sub(' ', query).strip().lower()
+
+
+class QueryEmbeddingCache():
+    """Two-level cache of query embeddings: an in-process LRU backed by an optional sqlite file.
+
+    Entries are keyed by content_key(embedder, model, instruction, normalized query), so
+    changing the model or the instruction string misses the old entries instead of
+    returning stale embeddings. Both levels are size-bounded and evict the least
+    recently used entries.
+
+    Args:
+        max_entries (int): Maximum number of embeddings kept in memory.
+        path (str, optional): sqlite file of the persistent level. None keeps the cache in memory only.
+        max_disk_entries (int): Maximum number of embeddings kept on disk.
+    """
+    def __init__(self, max_entries=1024, path=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.path = path
+        self.entries = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # shared by the threads of query_server.py
+        self.lock = threading.Lock()
+        self.db = None
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB, last_used REAL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self.db.commit()
+
+    def _remember(self, key, embedding):
+        self.entries[key] = embedding
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, embedder, model, instruction, query):
+        """Return the cached embedding of a query, or None."""
+        key = content_key(embedder, model, instruction, normalize_query(query))
+        with self.lock:
+            if key in self.entries:
+                self.memory_hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            if self.db is not None:
+                row = self.db.execute("SELECT embedding FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    embedding = np.frombuffer(row[0], dtype=np.float32).tolist()
+                    self.db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self.db.commit()
+                    self._remember(key, embedding)
+                    return embedding
+            self.misses += 1
+            return None
+
+    def set(self, embedder, model, instruction, query, embedding):
+        """Cache the embedding of a query in both levels."""
+        key = content_key(embedder, model, instruction, normalize_query(query))
+        with self.lock:
+            self._remember(key, embedding)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, embedding, last_used) VALUES (?, ?, ?)",
+                    (key, np.asarray(embedding, dtype=np.float32).tobytes(), time.time())
+                )
+                (count,) = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+                if count > self.max_disk_entries:
+                    self.db.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (count - self.max_disk_entries,)
+                    )
+                self.db.commit()
+
+    def stats(self):
+        """Return the hit/miss counters."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+        }
+
+
+def default_query_cache():
+    """Query cache persisted at $UE5_DOCS_QUERY_CACHE (default ./cache/query_embeddings.sqlite). 'none' keeps it in memory."""
+    path = os.getenv(QUERY_CACHE_ENV, DEFAULT_QUERY_CACHE_PATH)
+    if path.lower() == "none":
+        path = None
+    return QueryEmbeddingCache(path=path)
@@ -0,0 +1,76 @@
+import json
+import os
+from http.client import HTTPConnection, HTTPException
+from urllib.parse import urlparse
+
+QUERY_SERVER_ENV = "UE5_DOCS_QUERY_SERVER"
+# answers of a proxy or of a server that is overloaded or restarting: the query may succeed in-process
+UNAVAILABLE_STATUSES = (502, 503, 504)
+DEFAULT_QUERY_SERVER_URL = "http://localhost:8765"
+
+
+class QueryServerUnavailable(Exception):
+    """Raised when no query server answers at the given url, in time, or as available."""
+
+
+def get_query_server_url():
+    """Url of the query server: $UE5_DOCS_QUERY_SERVER, or the default local one. 'none' disables it."""
+    server_url = os.getenv(QUERY_SERVER_ENV, DEFAULT_QUERY_SERVER_URL)
+    if server_url.lower() == "none":
+        return None
+    return server_url
+
+
+def _request(server_url, method, path, body=None, timeout=60):
+    parsed_url = urlparse(server_url)
+    connection = HTTPConnection(parsed_url.hostname, parsed_url.port or 80, timeout=timeout)
+    try:
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        # refused connections, timeouts and broken responses alike
+        try:
+            connection.request(method, parsed_url.path.rstrip('/') + path, body=payload, headers=headers)
+            response = connection.getresponse()
+            raw_content = response.read()
+        except (OSError, HTTPException) as e:
+            raise QueryServerUnavailable(f"No query server at {server_url}: {e!r}")
+    finally:
+        connection.close()
+    if response.status in UNAVAILABLE_STATUSES:
+        raise QueryServerUnavailable(f"Query server at {server_url} is unavailable ({response.status})")
+    try:
+        content = json.loads(raw_content or b"{}")
+    except ValueError:
+        raise QueryServerUnavailable(f"Query server at {server_url} answered {response.status} with a non-json body")
+    # other errors, e.g. invalid options or a missing collection, would fail in-process too
+    if response.status != 200:
+        raise Exception(f"Query server error {response.status}: {content.get('error')}")
+    return content
+
+
+def server_health(server_url, timeout=1):
+    """Return the /health status of the query server, or None if it is not running."""
+    try:
+        return _request(server_url, "GET", "/health", timeout=timeout)
+    except QueryServerUnavailable:
+        return None
+
+
+def search_server(server_url, query, timeout=60, **options):
+    """Run a query on the query server.
+
+    Args:
+        server_url (str): e.g. 'http://localhost:8765'.
+        query (str): The query to search for.
+        timeout (float): Seconds to wait for the answer.
+        **options: Keyword arguments of query_index.query_index (embedder, top_k, block_types, ...).
+
+    Returns:
+        list of tuple: (url, text, score), as returned by query_index.
+
+    Raises:
+        QueryServerUnavailable: If no server is listening at `server_url`, it does not answer
+                                within `timeout` or it answers 502, 503 or 504.
+    """
+    content = _request(server_url, "POST", "/search", body={"query": query, **options}, timeout=timeout)
+    return [tuple(result) for result in content["results"]]
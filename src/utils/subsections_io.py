@@ -0,0 +1,89 @@
+import json
+import os
+
+
+def is_jsonl(path):
+    """Whether subsections at this path are stored as JSON lines (one record per page)."""
+    return path.endswith(".jsonl")
+
+
+def iter_subsections(path):
+    """Lazily iterate over the subsections produced by parse.py.
+
+    Both formats are supported: a single JSON dictionary (read at once) and JSON lines
+    (read one record at a time). A truncated last line, left by an interrupted crawl,
+    is ignored.
+
+    Args:
+        path (str): Path to subsections.json or subsections.jsonl.
+
+    Yields:
+        tuple: (url, subsection) where subsection holds at least "title" and "content".
+    """
+    if not is_jsonl(path):
+        with open(path, 'r') as f:
+            subsections = json.load(f)
+        yield from subsections.items()
+        return
+
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.endswith("\n"):
+                # partial record of an interrupted run
+                break
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            url = record.pop("url")
+            yield url, record
+
+
+def load_subsections(path):
+    """Load all subsections in memory.
+
+    Args:
+        path (str): Path to subsections.json or subsections.jsonl.
+
+    Returns:
+        dict: url -> subsection.
+    """
+    return dict(iter_subsections(path))
+
+
+class SubsectionWriter():
+    """Append-only JSON lines writer for parsed subsections.
+
+    Every record is flushed as soon as it is written, so an interrupted crawl keeps
+    all the pages parsed so far.
+
+    Args:
+        path (str): Output .jsonl path.
+        resume (bool): Append to an existing file instead of overwriting it.
+    """
+    def __init__(self, path, resume=False):
+        self.path = path
+        if resume and os.path.exists(path):
+            self._drop_partial_record()
+            self.file = open(path, 'a')
+        else:
+            self.file = open(path, 'w')
+
+    def _drop_partial_record(self):
+        with open(self.path, 'rb+') as f:
+            content = f.read()
+            if content and not content.endswith(b"\n"):
+                f.truncate(content.rfind(b"\n") + 1)
+
+    def write(self, url, subsection):
+        record = {"url": url, **subsection}
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,56 @@
+import functools
+import math
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# count_tokens undercounts the OpenAI tokenizer, its estimates are scaled by this
+# factor when tiktoken is not installed so that rate limit budgets are not overrun
+OPENAI_TOKEN_SAFETY_FACTOR = 1.3
+
+
+def count_tokens(text):
+    """Estimate the number of tokens of a text.
+
+    Words and punctuation marks are counted as one token each, which is close to
+    (slightly below) what the subword tokenizers of our embedders produce on
+    English documentation.
+
+    Args:
+        text (str): Text to measure.
+
+    Returns:
+        int: Estimated number of tokens.
+    """
+    return len(TOKEN_PATTERN.findall(text))
+
+
+@functools.lru_cache(maxsize=None)
+def _openai_encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # text-embedding-ada-002 and its successors use cl100k_base
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_openai_tokens(text, model):
+    """Number of tokens of a text for an OpenAI model, as billed and rate limited.
+
+    Exact with tiktoken, otherwise an upper estimate: count_tokens scaled by
+    OPENAI_TOKEN_SAFETY_FACTOR.
+
+    Args:
+        text (str): Text to measure.
+        model (str): OpenAI model, e.g. "text-embedding-ada-002".
+
+    Returns:
+        int: Number of tokens.
+    """
+    encoding = _openai_encoding(model)
+    if encoding is None:
+        return math.ceil(count_tokens(text) * OPENAI_TOKEN_SAFETY_FACTOR)
+    return len(encoding.encode(text, disallowed_special=()))